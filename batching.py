@@ -0,0 +1,165 @@
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+
+
+# Fraction of a padded (source + target) batch that is padding
+def padding_ratio(src_lengths, tgt_lengths):
+    padded = len(src_lengths) * (max(src_lengths) + max(tgt_lengths))
+    return 1.0 - float(sum(src_lengths) + sum(tgt_lengths)) / padded
+
+
+class BucketBatchSampler:
+    # Groups pairs into buckets of bucket_width positions along both the
+    # source and the target length. Every epoch shuffles within each bucket,
+    # cuts the buckets into batches and shuffles the batches, so each pair is
+    # drawn exactly once per epoch and batches hold pairs of similar length.
+    #
+    # With max_tokens set, batches are cut to at most that many padded
+    # source + target tokens instead, and batch_size (if any) only caps the
+    # number of pairs per batch.
+    def __init__(self, src_lengths, tgt_lengths, batch_size, bucket_width=5, max_tokens=None, seed=None):
+        self.src_lengths = np.asarray(src_lengths)
+        self.tgt_lengths = np.asarray(tgt_lengths)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.rng = np.random.RandomState(seed)
+        self.epoch = 0
+
+        tgt_buckets = self.tgt_lengths.max() // bucket_width + 1
+        keys = (self.src_lengths // bucket_width) * tgt_buckets + self.tgt_lengths // bucket_width
+        order = np.argsort(keys, kind='stable')
+        self.buckets = np.split(order, np.flatnonzero(np.diff(keys[order])) + 1)
+
+    # Batches per epoch (an estimate with max_tokens, where it depends on the shuffle)
+    def __len__(self):
+        return sum(len(self.split(bucket)) for bucket in self.buckets)
+
+    def split(self, bucket):
+        if self.max_tokens is None:
+            return [bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size)]
+
+        batches = []
+        start = 0
+        max_src = max_tgt = 0
+        for i, pair in enumerate(bucket):
+            max_src = max(max_src, self.src_lengths[pair])
+            max_tgt = max(max_tgt, self.tgt_lengths[pair])
+            size = i - start + 1
+            if i > start and (size * (max_src + max_tgt) > self.max_tokens or
+                              (self.batch_size is not None and size > self.batch_size)):
+                batches.append(bucket[start:i])
+                start = i
+                max_src = self.src_lengths[pair]
+                max_tgt = self.tgt_lengths[pair]
+        batches.append(bucket[start:])
+        return batches
+
+    # One epoch of batches, without replacement
+    def __iter__(self):
+        self.epoch += 1
+        batches = []
+        for bucket in self.buckets:
+            batches.extend(self.split(self.rng.permutation(bucket)))
+        for i in self.rng.permutation(len(batches)):
+            yield batches[i].tolist()
+
+    # Restoring this before iterating resumes with the data epoch after the saved one
+    def state_dict(self):
+        return {'epoch': self.epoch, 'rng': self.rng.get_state()}
+
+    def load_state_dict(self, state):
+        self.epoch = state['epoch']
+        self.rng.set_state(state['rng'])
+
+
+class PairDataset(Dataset):
+    # Training pairs from two TokenArrays, with EOS appended
+    def __init__(self, src, tgt, eos_token):
+        self.src = src
+        self.tgt = tgt
+        self.eos_token = eos_token
+
+    def __len__(self):
+        return len(self.src)
+
+    def __getitem__(self, i):
+        return self.src[i].tolist() + [self.eos_token], self.tgt[i].tolist() + [self.eos_token]
+
+
+class PadCollate:
+    def __init__(self, pad_token):
+        self.pad_token = pad_token
+
+    def __call__(self, batch):
+        # Sort by source length (descending) for packing
+        batch = sorted(batch, key=lambda p: len(p[0]), reverse=True)
+        input_lengths = [len(src) for src, _ in batch]
+        target_lengths = [len(tgt) for _, tgt in batch]
+
+        # (max_len x batch_size) tensors padded with pad_token
+        input_var = torch.full((max(input_lengths), len(batch)), self.pad_token, dtype=torch.long)
+        target_var = torch.full((max(target_lengths), len(batch)), self.pad_token, dtype=torch.long)
+        for j, (src, tgt) in enumerate(batch):
+            input_var[:len(src), j] = torch.LongTensor(src)
+            target_var[:len(tgt), j] = torch.LongTensor(tgt)
+
+        return input_var, input_lengths, target_var, target_lengths
+
+
+# Padded batches over the first limit pairs of dataset (or the pairs in
+# indices) in descending source length, for evaluation where order does not
+# matter but padding does. Batches are built as they are consumed.
+def sorted_batches(dataset, batch_size, pad_token, limit=None, indices=None):
+    if indices is None:
+        indices = range(len(dataset) if limit is None else min(len(dataset), limit))
+    order = sorted(indices, key=lambda i: len(dataset.src[i]), reverse=True)
+    collate = PadCollate(pad_token)
+    for first in range(0, len(order), batch_size):
+        yield collate([dataset[i] for i in order[first:first + batch_size]])
+
+
+def make_loader(dataset, batch_sampler, pad_token, num_workers=2, prefetch_batches=4, pin_memory=False):
+    # Workers index, pad and sort batches off the training thread; each keeps up
+    # to prefetch_batches ready batches queued
+    kwargs = {}
+    if num_workers > 0:
+        kwargs = {'prefetch_factor': prefetch_batches, 'persistent_workers': True}
+    return DataLoader(dataset, batch_sampler=batch_sampler, collate_fn=PadCollate(pad_token),
+                      num_workers=num_workers, pin_memory=pin_memory, **kwargs)
+
+
+class BatchStream:
+    # Endless stream of batches from a DataLoader, restarting it every epoch.
+    # Batches are moved to device, and wait_time accumulates the time the
+    # training loop spent blocked on data.
+    def __init__(self, loader, device=torch.device('cpu')):
+        self.loader = loader
+        self.device = device
+        self.iterator = iter(loader)
+        self.wait_time = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.time()
+        try:
+            batch = next(self.iterator)
+        except StopIteration:
+            self.iterator = iter(self.loader)
+            batch = next(self.iterator)
+
+        input_var, input_lengths, target_var, target_lengths = batch
+        input_var = input_var.to(self.device, non_blocking=True)
+        target_var = target_var.to(self.device, non_blocking=True)
+        self.wait_time += time.time() - start
+        return input_var, input_lengths, target_var, target_lengths
+
+    # Data wait time since the last call
+    def pop_wait_time(self):
+        wait_time = self.wait_time
+        self.wait_time = 0.0
+        return wait_time
@@ -0,0 +1,111 @@
+"""Training and decoding throughput and peak memory of bf16 autocast against fp32.
+
+Uses random batches, so no corpus is needed. Run from the repository root:
+
+    python -m benchmarks.amp --batch-size 32 --src-len 50 --tgt-len 15 --vocab-size 30000
+"""
+import argparse
+import resource
+import time
+
+import torch
+from torch import optim
+
+from benchmarks.isolated import run_isolated
+from device import autocast, configure_cpu, get_device, prepare_model
+from inference import greedy_decode
+from lang import SOS_token, EOS_token
+from masked_cross_entropy import masked_cross_entropy
+from model import EncoderRNN, LuongAttnDecoderRNN, attention_mask
+
+
+def make_batch(args, device):
+    src_lengths = sorted(torch.randint(args.src_len // 2, args.src_len + 1, (args.batch_size,)).tolist(),
+                         reverse=True)
+    src_lengths[0] = args.src_len
+    tgt_lengths = torch.randint(args.tgt_len // 2, args.tgt_len + 1, (args.batch_size,)).tolist()
+    input_batches = torch.randint(4, args.vocab_size, (args.src_len, args.batch_size), device=device)
+    target_batches = torch.randint(4, args.vocab_size, (args.tgt_len, args.batch_size), device=device)
+    return input_batches, src_lengths, target_batches, tgt_lengths
+
+
+def train_step(encoder, decoder, optimizer, batch, bf16):
+    input_batches, input_lengths, target_batches, target_lengths = batch
+    optimizer.zero_grad()
+    with autocast(input_batches.device, bf16):
+        encoder_outputs, encoder_hidden = encoder(input_batches, input_lengths, None)
+        sos = torch.full((1, input_batches.size(1)), SOS_token, dtype=torch.long, device=input_batches.device)
+        decoder_inputs = torch.cat((sos, target_batches[:-1]), 0)
+        outputs, _, _ = decoder.forward_sequence(decoder_inputs, encoder_hidden[:decoder.n_layers], encoder_outputs,
+                                                 attn_mask=attention_mask(input_lengths, encoder_outputs))
+        loss = masked_cross_entropy(outputs.transpose(0, 1).contiguous(), target_batches.t().contiguous(),
+                                    target_lengths)
+    loss.backward()
+    optimizer.step()
+    return loss.item()
+
+
+def synchronize(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def run(bf16, args):
+    # Throughput and peak memory of one precision, in its own process
+    configure_cpu(args.threads)
+    device = get_device(args.cuda)
+    torch.manual_seed(2018)
+    encoder = prepare_model(EncoderRNN(args.vocab_size, args.hidden_size, args.hidden_size, args.n_layers), device)
+    decoder = prepare_model(LuongAttnDecoderRNN(args.attn_model, args.hidden_size, args.hidden_size,
+                                                args.vocab_size, args.n_layers), device)
+    optimizer = optim.Adam(list(encoder.parameters()) + list(decoder.parameters()), lr=0.0001)
+    batch = make_batch(args, device)
+    tokens = sum(batch[1]) + sum(batch[3])
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+
+    first_loss = train_step(encoder, decoder, optimizer, batch, bf16)
+    synchronize(device)
+    start = time.time()
+    for _ in range(args.steps):
+        train_step(encoder, decoder, optimizer, batch, bf16)
+    synchronize(device)
+    train_time = time.time() - start
+
+    encoder.eval()
+    decoder.eval()
+    start = time.time()
+    with torch.no_grad(), autocast(device, bf16):
+        for _ in range(args.steps):
+            greedy_decode(encoder, decoder, batch[0], batch[1], SOS_token, EOS_token, args.tgt_len)
+    synchronize(device)
+    decode_time = time.time() - start
+
+    if device.type == 'cuda':
+        peak = torch.cuda.max_memory_allocated() / 2 ** 20
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    return first_loss, args.steps * tokens / train_time, args.steps * args.batch_size / decode_time, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--src-len', type=int, default=50)
+    parser.add_argument('--tgt-len', type=int, default=15)
+    parser.add_argument('--vocab-size', type=int, default=30000)
+    parser.add_argument('--attn-model', default='dot')
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    parser.add_argument('--cuda', action='store_true')
+    args = parser.parse_args()
+
+    print('%-5s %10s %14s %16s %10s' % ('mode', 'loss', 'train tok/s', 'decode sent/s', 'peak MB'))
+    for name, bf16 in (('fp32', False), ('bf16', True)):
+        print('%-5s %10.4f %14.1f %16.1f %10.1f' % ((name,) + run_isolated(run, bf16, args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Steps/sec of Attn.forward against the original per-cell scoring loop.
+
+Run from the repository root:
+
+    python -m benchmarks.attention --batch-size 8 --max-len 50 --hidden-size 256
+"""
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from model import Attn
+
+
+def loop_forward(attn, hidden, encoder_outputs):
+    # Attn.forward as it was: one score() call per (batch, source position) cell
+    max_len = encoder_outputs.size(0)
+    this_batch_size = encoder_outputs.size(1)
+    attn_energies = torch.zeros(this_batch_size, max_len, device=encoder_outputs.device)
+    for b in range(this_batch_size):
+        for i in range(max_len):
+            attn_energies[b, i] = attn.score(hidden[:, b], encoder_outputs[i, b].unsqueeze(0))
+    return F.log_softmax(attn_energies, dim=1).unsqueeze(1)
+
+
+def steps_per_sec(fn, steps, device):
+    fn()  # warm up
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(steps):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return steps / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-len', type=int, default=50)
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--cuda', action='store_true')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    torch.manual_seed(2018)
+    hidden = torch.randn(1, args.batch_size, args.hidden_size, device=device)
+    encoder_outputs = torch.randn(args.max_len, args.batch_size, args.hidden_size, device=device)
+
+    print('%-8s %12s %12s %8s %10s' % ('method', 'loop it/s', 'batched it/s', 'speedup', 'max diff'))
+    for method in ('dot', 'general', 'concat'):
+        attn = Attn(method, args.hidden_size).to(device)
+        if method == 'concat':
+            nn.init.normal_(attn.v)
+
+        with torch.no_grad():
+            expected = loop_forward(attn, hidden, encoder_outputs)
+            actual = attn(hidden, encoder_outputs)
+            max_diff = (expected - actual).abs().max().item()
+            assert torch.allclose(expected, actual, atol=1e-4), method
+
+            before = steps_per_sec(lambda: loop_forward(attn, hidden, encoder_outputs), args.steps, device)
+            after = steps_per_sec(lambda: attn(hidden, encoder_outputs), args.steps, device)
+
+        print('%-8s %12.1f %12.1f %7.1fx %10.2e' % (method, before, after, after / before, max_diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Training steps/sec of the whole-sequence teacher-forced decoder against the step-by-step loop.
+
+First asserts that compute_loss gives the same loss and encoder and decoder
+gradients with sequence_decoder=True as with the per-step loop, for every
+attention method (dropout is off, so both passes see the same network);
+--check stops after that. Uses random batches, so no corpus is needed. Run
+from the repository root:
+
+    python -m benchmarks.decoder --batch-size 32 --src-len 50 --tgt-len 15 --vocab-size 30000
+"""
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+
+from benchmarks.amp import make_batch, synchronize
+from device import configure_cpu, get_device, prepare_model
+from model import EncoderRNN, LuongAttnDecoderRNN
+from trainer import compute_loss
+
+
+def loss_and_grads(batch, encoder, decoder, sequence_decoder):
+    encoder.zero_grad()
+    decoder.zero_grad()
+    loss = compute_loss(*batch, encoder, decoder, sequence_decoder=sequence_decoder)
+    loss.backward()
+    return loss.detach(), [p.grad.clone() for model in (encoder, decoder) for p in model.parameters()]
+
+
+def steps_per_sec(fn, steps, device):
+    fn()  # warm up
+    synchronize(device)
+    start = time.time()
+    for _ in range(steps):
+        fn()
+    synchronize(device)
+    return steps / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--src-len', type=int, default=50)
+    parser.add_argument('--tgt-len', type=int, default=15)
+    parser.add_argument('--vocab-size', type=int, default=30000)
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    parser.add_argument('--cuda', action='store_true')
+    parser.add_argument('--check', action='store_true', help='only check the losses and gradients, without timing')
+    args = parser.parse_args()
+    configure_cpu(args.threads)
+    device = get_device(args.cuda)
+
+    torch.manual_seed(2018)
+    batch = make_batch(args, device)
+
+    print('%-8s %12s %14s %8s %10s' % ('method', 'step it/s', 'sequence it/s', 'speedup', 'max diff'))
+    for method in ('dot', 'general', 'concat'):
+        encoder = prepare_model(EncoderRNN(args.vocab_size, args.hidden_size, args.hidden_size, args.n_layers,
+                                           dropout=0), device)
+        decoder = prepare_model(LuongAttnDecoderRNN(method, args.hidden_size, args.hidden_size, args.vocab_size,
+                                                    args.n_layers, dropout=0), device)
+        if method == 'concat':
+            nn.init.normal_(decoder.attn.v)
+
+        expected_loss, expected_grads = loss_and_grads(batch, encoder, decoder, False)
+        loss, grads = loss_and_grads(batch, encoder, decoder, True)
+        assert torch.allclose(expected_loss, loss, atol=1e-5), '%s loss: %r != %r' % (method, loss, expected_loss)
+        names = [name for model in (encoder, decoder) for name, _ in model.named_parameters()]
+        for name, expected, actual in zip(names, expected_grads, grads):
+            assert torch.allclose(expected, actual, atol=1e-4), '%s: gradient of %s' % (method, name)
+        max_diff = max((expected - actual).abs().max().item() for expected, actual in zip(expected_grads, grads))
+        if args.check:
+            print('%-8s %12s %14s %8s %10.2e' % (method, '-', '-', '-', max_diff))
+            continue
+
+        before = steps_per_sec(lambda: loss_and_grads(batch, encoder, decoder, False), args.steps, device)
+        after = steps_per_sec(lambda: loss_and_grads(batch, encoder, decoder, True), args.steps, device)
+        print('%-8s %12.1f %14.1f %7.1fx %10.2e' % (method, before, after, after / before, max_diff))
+
+
+if __name__ == '__main__':
+    main()
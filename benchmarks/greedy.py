@@ -0,0 +1,69 @@
+"""Throughput of batched greedy decoding (Evaluator.evaluate_batch) against batch size.
+
+Decodes the compiled validation articles (see preprocess.py) once per batch
+size; sentences/s should grow roughly linearly until the device saturates.
+Attention is masked to each article's length, so the summaries should not
+change with the batch size; the agreement column compares them with the first
+batch size's.
+Run from the repository root:
+
+    python -m benchmarks.greedy --checkpoint model/checkpoint_00010000.pkl --batch-sizes 1 8 32 128
+"""
+import argparse
+import time
+
+import torch
+
+from checkpoint import load_checkpoint
+from device import get_device, configure_cpu
+from evaluator import Evaluator
+from inference import agreement
+from lang import sentence_from_indexes
+from preprocess import COMPILED_DIR, load_corpus
+from trainer import load_models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+    parser.add_argument('--checkpoint', help='checkpoint saved by train.py (random default-size model if omitted)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16, 64, 256])
+    parser.add_argument('--max-length', type=int, default=30)
+    parser.add_argument('--max-sentences', type=int, default=1000)
+    parser.add_argument('--cuda', action='store_true')
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    parser.add_argument('--interop-threads', type=int, help='CPU inter-op threads')
+    args = parser.parse_args()
+    configure_cpu(args.threads, args.interop_threads)
+    device = get_device(args.cuda)
+
+    input_lang, output_lang, _, (valid_src, _) = load_corpus(args.data_dir)
+    checkpoint = load_checkpoint(args.checkpoint) if args.checkpoint else None
+    encoder, decoder = load_models(checkpoint, input_lang, output_lang, device)
+    evaluator = Evaluator(encoder, decoder, input_lang, output_lang, device)
+
+    sentences = [sentence_from_indexes(input_lang, valid_src[i])
+                 for i in range(min(len(valid_src), args.max_sentences))]
+    evaluator.evaluate_batch(sentences[:max(args.batch_sizes)], max(args.batch_sizes), args.max_length)  # Warm up
+
+    print('%d validation sentences on %s, %d CPU threads' % (len(sentences), device, torch.get_num_threads()))
+    print('%10s %10s %14s %10s %10s %10s' % ('batch size', 'seconds', 'sentences/s', 'speedup', 'linear',
+                                              'agreement'))
+    first_rate = None
+    first_summaries = None
+    for batch_size in args.batch_sizes:
+        start = time.time()
+        summaries = evaluator.evaluate_batch(sentences, batch_size, args.max_length)
+        seconds = time.time() - start
+        rate = len(sentences) / seconds
+        first_rate = first_rate or rate
+        first_summaries = first_summaries or summaries
+        # Speedup over the first batch size, what linear scaling would give, and
+        # the fraction of summaries identical to the first batch size's
+        print('%10d %10.2f %14.1f %9.1fx %9.1fx %9.1f%%' % (
+            batch_size, seconds, rate, rate / first_rate, float(batch_size) / args.batch_sizes[0],
+            100 * agreement(summaries, first_summaries)[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import multiprocessing
+
+
+# func(*args) in a fresh spawned process, so the peak memory it reports is its
+# own rather than hidden by an earlier run's high-water mark in this process
+def run_isolated(func, *args):
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(func, args)
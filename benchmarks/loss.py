@@ -0,0 +1,94 @@
+"""Peak memory and gradients of chunked_masked_cross_entropy against masked_cross_entropy.
+
+First asserts that the chunked loss and its gradients match
+masked_cross_entropy. CPU memory is read from /proc, so it needs Linux. Run
+from the repository root:
+
+    python -m benchmarks.loss --batch-size 32 --max-len 15 --vocab-size 50000
+"""
+import argparse
+
+import torch
+import torch.nn as nn
+
+from benchmarks.isolated import run_isolated
+from masked_cross_entropy import masked_cross_entropy, chunked_masked_cross_entropy
+
+
+def make_inputs(args, device):
+    torch.manual_seed(2018)
+    out = nn.Linear(args.hidden_size, args.vocab_size).to(device)
+    features = torch.randn(args.max_len, args.batch_size, args.hidden_size, device=device, requires_grad=True)
+    target = torch.randint(args.vocab_size, (args.max_len, args.batch_size), device=device)
+    lengths = torch.randint(1, args.max_len + 1, (args.batch_size,)).tolist()
+    lengths[0] = args.max_len
+    return out, features, target, lengths
+
+
+def run_loss(mode, args, out, features, target, lengths):
+    if mode == 'chunked':
+        loss = chunked_masked_cross_entropy(features, out.weight, out.bias, target, lengths, args.chunk_size)
+    else:
+        logits = out(features)
+        loss = masked_cross_entropy(logits.transpose(0, 1).contiguous(), target.t().contiguous(), lengths)
+    loss.backward()
+    return loss
+
+
+# Current (VmRSS) or peak (VmHWM) resident memory of this process in MB
+def resident_memory(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 2 ** 10
+
+
+def peak_memory(mode, args):
+    # Peak memory of one loss + backward, in MB above what the inputs already use
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    out, features, target, lengths = make_inputs(args, device)
+    if args.cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        before = torch.cuda.memory_allocated()
+        run_loss(mode, args, out, features, target, lengths)
+        torch.cuda.synchronize()
+        return (torch.cuda.max_memory_allocated() - before) / 2 ** 20
+    # Reset the kernel's high-water mark to the current resident size, so the
+    # peak is the loss's and not whatever came before (e.g. importing torch)
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    before = resident_memory('VmRSS')
+    run_loss(mode, args, out, features, target, lengths)
+    return resident_memory('VmHWM') - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-len', type=int, default=15)
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--vocab-size', type=int, default=50000)
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--cuda', action='store_true')
+    args = parser.parse_args()
+    device = torch.device('cuda' if args.cuda else 'cpu')
+
+    # The chunked loss and its gradients must match masked_cross_entropy on the same inputs
+    results = {}
+    for mode in ('full', 'chunked'):
+        out, features, target, lengths = make_inputs(args, device)
+        loss = run_loss(mode, args, out, features, target, lengths)
+        results[mode] = [loss.detach(), features.grad, out.weight.grad, out.bias.grad]
+    for name, expected, actual in zip(('loss', 'features grad', 'weight grad', 'bias grad'), results['full'],
+                                      results['chunked']):
+        assert torch.allclose(actual, expected, rtol=1e-4, atol=1e-7), '%s differs by up to %.2e' % (
+            name, (actual - expected).abs().max().item())
+    print('loss %.6f and its gradients match masked_cross_entropy' % results['full'][0].item())
+
+    for mode in ('full', 'chunked'):
+        print('%-8s peak %8.1f MB' % (mode, run_isolated(peak_memory, mode, args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Throughput and agreement of fast_rouge_scores against the pure-Python rouge_scores.
+
+Scores random token-id summaries against random references, so no corpus or
+model is needed. First asserts that both give the same scores on edge cases
+(empty and one-word sequences, repeated n-grams, ids large enough to split a
+chunk, several worker processes); --check stops after that. Run from the
+repository root:
+
+    python -m benchmarks.rouge --pairs 50000 --vocab-size 30000 --max-len 15
+"""
+import argparse
+import time
+
+import numpy as np
+
+from rouge import fast_rouge_scores, rouge_scores
+
+
+# Pairs of similar summaries: each reference shares a random subset of its
+# hypothesis' ids, so the scores are spread out rather than all near zero
+def random_pairs(pairs, vocab_size, max_len, first_id=4):
+    rng = np.random.RandomState(2018)
+    hypotheses = []
+    references = []
+    for _ in range(pairs):
+        hypothesis = rng.randint(first_id, first_id + vocab_size, rng.randint(1, max_len + 1))
+        reference = rng.randint(first_id, first_id + vocab_size, rng.randint(1, max_len + 1))
+        shared = rng.rand(min(len(hypothesis), len(reference))) < 0.5
+        reference[:len(shared)][shared] = hypothesis[:len(shared)][shared]
+        hypotheses.append(hypothesis.tolist())
+        references.append(reference.tolist())
+    return hypotheses, references
+
+
+def assert_agrees(hypotheses, references, processes=1, chunk_size=5000):
+    expected = rouge_scores(hypotheses, references)
+    scores = fast_rouge_scores(hypotheses, references, processes, chunk_size)
+    for name in expected:
+        assert abs(scores[name] - expected[name]) < 1e-9, '%s: %r != %r for %r / %r' % (
+            name, scores[name], expected[name], hypotheses[:3], references[:3])
+
+
+def check():
+    cases = [
+        ([], []), ([], [4]), ([4], []),  # empty sequences
+        ([4], [4]), ([4], [5]), ([4], [5, 4, 6]),  # one word
+        ([5, 5, 5, 5], [5, 5]), ([1, 2, 1, 2, 1], [2, 1, 2]), ([7, 8, 7, 8], [7, 8, 9, 7, 8]),  # repeated n-grams
+        ([7, 8, 9], [9, 8, 7]), ([1, 2, 3, 4, 5], [1, 3, 5, 2, 4]),
+    ]
+    for hypothesis, reference in cases:
+        assert_agrees([hypothesis], [reference])
+    hypotheses, references = [list(side) for side in zip(*cases)]
+    assert_agrees(hypotheses, references)
+
+    # Ids near 2 ** 29 make 200 pairs' bigram keys overflow int64, so rouge_sums splits the chunk
+    assert_agrees(*random_pairs(200, 50, 15, first_id=2 ** 29))
+    # Many chunks scored by a process pool
+    assert_agrees(*random_pairs(2000, 100, 15), processes=2, chunk_size=300)
+    print('fast_rouge_scores agrees with rouge_scores')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=50000)
+    parser.add_argument('--vocab-size', type=int, default=30000)
+    parser.add_argument('--max-len', type=int, default=15)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, None],
+                        help='worker counts to time fast_rouge_scores with (0 means one per CPU)')
+    parser.add_argument('--check', action='store_true', help='only check the scores, without timing')
+    args = parser.parse_args()
+    check()
+    if args.check:
+        return
+    hypotheses, references = random_pairs(args.pairs, args.vocab_size, args.max_len)
+
+    start = time.perf_counter()
+    expected = rouge_scores(hypotheses, references)
+    seconds = time.perf_counter() - start
+    print('%-22s %12s %10s %s' % ('scorer', 'pairs/s', 'speedup', 'max abs diff'))
+    print('%-22s %12.0f %10s %s' % ('python', args.pairs / seconds, '1.0x', '-'))
+
+    for processes in args.processes:
+        start = time.perf_counter()
+        scores = fast_rouge_scores(hypotheses, references, processes or None, args.chunk_size)
+        fast_seconds = time.perf_counter() - start
+        difference = max(abs(scores[name] - expected[name]) for name in expected)
+        print('%-22s %12.0f %9.1fx %.2e' % ('numpy (%s processes)' % (processes or 'all'),
+                                             args.pairs / fast_seconds, seconds / fast_seconds, difference))
+
+
+if __name__ == '__main__':
+    main()
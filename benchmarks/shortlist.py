@@ -0,0 +1,72 @@
+"""Speed and agreement of shortlist greedy decoding against the full output vocabulary.
+
+Decodes the compiled validation articles (see preprocess.py) twice with the
+same model. Run from the repository root:
+
+    python -m benchmarks.shortlist --checkpoint model/checkpoint_00010000.pkl
+"""
+import argparse
+import time
+
+from batching import PairDataset, sorted_batches
+from checkpoint import load_checkpoint
+from device import get_device, configure_cpu
+from inference import agreement, decode_batches
+from lang import PAD_token, SOS_token, EOS_token
+from model import AdaptiveOutput
+from preprocess import COMPILED_DIR, load_corpus
+from shortlist import build_shortlist
+from trainer import load_models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+    parser.add_argument('--checkpoint', help='checkpoint saved by train.py (random default-size model if omitted)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-length', type=int, default=30)
+    parser.add_argument('--max-sentences', type=int, default=2000)
+    parser.add_argument('--top-k', type=int, default=1000)
+    parser.add_argument('--translations', type=int, default=10)
+    parser.add_argument('--cuda', action='store_true')
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    parser.add_argument('--interop-threads', type=int, help='CPU inter-op threads')
+    args = parser.parse_args()
+    configure_cpu(args.threads, args.interop_threads)
+    device = get_device(args.cuda)
+
+    input_lang, output_lang, (train_src, train_tgt), (valid_src, valid_tgt) = load_corpus(args.data_dir)
+    checkpoint = load_checkpoint(args.checkpoint) if args.checkpoint else None
+    encoder, decoder = load_models(checkpoint, input_lang, output_lang, device)
+    if isinstance(decoder.out, AdaptiveOutput):
+        parser.error('shortlists need a dense output layer; this checkpoint uses an adaptive softmax')
+    encoder.eval()
+    decoder.eval()
+
+    start = time.time()
+    shortlist = build_shortlist(input_lang, output_lang, train_src, train_tgt, args.top_k, args.translations)
+    print('Built shortlist in %.1fs' % (time.time() - start))
+
+    # Length-sorted validation batches
+    batches = []
+    candidates = 0
+    for input_batches, input_lengths, target_batches, target_lengths in sorted_batches(
+            PairDataset(valid_src, valid_tgt, EOS_token), args.batch_size, PAD_token, args.max_sentences):
+        input_batches = input_batches.to(device)
+        candidates += len(shortlist.candidates(input_batches))
+        batches.append((input_batches, input_lengths, target_batches, target_lengths))
+    n = sum(len(batch[1]) for batch in batches)
+
+    full, full_time = decode_batches(encoder, decoder, batches, SOS_token, EOS_token, args.max_length)
+    fast, fast_time = decode_batches(encoder, decoder, batches, SOS_token, EOS_token, args.max_length, shortlist)
+
+    same_sequences, same_tokens = agreement(fast, full)
+    print('%d sentences, %.0f candidates per batch out of %d words' % (
+        n, float(candidates) / len(batches), output_lang.n_words))
+    print('full      %8.2fs  %8.1f sentences/s' % (full_time, n / full_time))
+    print('shortlist %8.2fs  %8.1f sentences/s  (%.2fx)' % (fast_time, n / fast_time, full_time / fast_time))
+    print('agreement: %.1f%% of sentences, %.1f%% of tokens' % (100 * same_sequences, 100 * same_tokens))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Cold-start time of the entry points and of importing the library modules.
+
+Every measurement is a fresh interpreter, so it includes loading Python,
+torch and numpy. Run from the repository root:
+
+    python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    ('import model', ['-c', 'import model']),
+    ('import trainer', ['-c', 'import trainer']),
+    ('import evaluator', ['-c', 'import evaluator']),
+    ('import visualize', ['-c', 'import visualize']),
+    ('train.py --help', ['train.py', '--help']),
+    ('evaluate.py --help', ['evaluate.py', '--help']),
+    ('preprocess.py --help', ['preprocess.py', '--help']),
+]
+
+
+def run(arguments):
+    start = time.time()
+    subprocess.run([sys.executable] + arguments, check=True, stdout=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = [run(['-c', 'pass']) for _ in range(args.repeat)]
+    print('%-22s %8s %8s' % ('', 'min', 'median'))
+    print('%-22s %7.3fs %7.3fs' % ('python', min(baseline), statistics.median(baseline)))
+    for name, arguments in COMMANDS:
+        times = [run(arguments) for _ in range(args.repeat)]
+        print('%-22s %7.3fs %7.3fs' % (name, min(times), statistics.median(times)))
+
+
+if __name__ == '__main__':
+    main()
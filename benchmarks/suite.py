@@ -0,0 +1,252 @@
+"""Microbenchmarks of the model hot paths over a grid of sizes, with JSON baselines.
+
+Times Attn.forward (dot, general, concat), EncoderRNN.forward, one
+LuongAttnDecoderRNN step, a full Trainer.train step, masked_cross_entropy,
+collating a random batch (what random_batch did) and utils.build_dataset.
+Run from the repository root:
+
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.1
+
+With --baseline, cases slower than the baseline by more than --threshold
+are flagged and the exit status is 1.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from batching import PairDataset, PadCollate
+from device import configure_cpu, get_device, prepare_model
+from lang import PAD_token, EOS_token
+from masked_cross_entropy import masked_cross_entropy
+from model import Attn, EncoderRNN, LuongAttnDecoderRNN
+from trainer import Trainer
+
+TGT_LEN = 15  # Target length of the summaries (utils.summary_max_len)
+GRID = {'batch': [8, 32], 'src': [20, 50], 'hidden': [128, 256], 'vocab': [5000, 30000]}
+QUICK_GRID = {'batch': [8], 'src': [20], 'hidden': [128], 'vocab': [5000]}
+
+
+def random_batch(case, device, tgt_len=TGT_LEN):
+    lengths = sorted(np.random.randint(case['src'] // 2, case['src'] + 1, case['batch']).tolist(), reverse=True)
+    lengths[0] = case['src']
+    target_lengths = np.random.randint(tgt_len // 2, tgt_len + 1, case['batch']).tolist()
+    input_batches = torch.randint(4, case['vocab'], (case['src'], case['batch']), device=device)
+    target_batches = torch.randint(4, case['vocab'], (tgt_len, case['batch']), device=device)
+    return input_batches, lengths, target_batches, target_lengths
+
+
+# Every benchmark takes the parameters it depends on and returns a no-argument
+# function to time; everything else it does is setup and is not timed. Setups
+# with something to clean up are context managers yielding the function.
+
+def bench_attention(method):
+    def setup(case, device):
+        attn = Attn(method, case['hidden']).to(device)
+        if method == 'concat':
+            torch.nn.init.normal_(attn.v)
+        hidden = torch.randn(1, case['batch'], case['hidden'], device=device)
+        encoder_outputs = torch.randn(case['src'], case['batch'], case['hidden'], device=device)
+        return lambda: attn(hidden, encoder_outputs)
+    return setup
+
+
+def bench_encoder(case, device):
+    encoder = prepare_model(EncoderRNN(case['vocab'], case['hidden'], case['hidden'], 2), device)
+    input_batches, input_lengths, _, _ = random_batch(case, device)
+    return lambda: encoder(input_batches, input_lengths, None)
+
+
+def bench_decoder_step(case, device):
+    decoder = prepare_model(LuongAttnDecoderRNN('dot', case['hidden'], case['hidden'], case['vocab'], 2), device)
+    decoder_input = torch.randint(4, case['vocab'], (case['batch'],), device=device)
+    decoder_hidden = torch.randn(2, case['batch'], case['hidden'], device=device)
+    encoder_outputs = torch.randn(case['src'], case['batch'], case['hidden'], device=device)
+    attn_keys = decoder.attn.precompute(encoder_outputs)
+    return lambda: decoder(decoder_input, decoder_hidden, encoder_outputs, attn_keys)
+
+
+def bench_train_step(case, device):
+    encoder = prepare_model(EncoderRNN(case['vocab'], case['hidden'], case['hidden'], 2), device)
+    decoder = prepare_model(LuongAttnDecoderRNN('dot', case['hidden'], case['hidden'], case['vocab'], 2), device)
+    trainer = Trainer(encoder, decoder)
+    batches = [random_batch(case, device)]
+    return lambda: trainer.train(batches)
+
+
+def bench_masked_cross_entropy(case, device):
+    logits = torch.randn(case['batch'], TGT_LEN, case['vocab'], device=device)
+    target = torch.randint(case['vocab'], (case['batch'], TGT_LEN), device=device)
+    length = np.random.randint(1, TGT_LEN + 1, case['batch']).tolist()
+    return lambda: masked_cross_entropy(logits, target, length)
+
+
+def bench_collate(case, device):
+    # A random batch from a corpus of 10000 pairs, padded and moved to device
+    src = [np.random.randint(4, 1000, n) for n in np.random.randint(1, case['src'] + 1, 10000)]
+    tgt = [np.random.randint(4, 1000, n) for n in np.random.randint(1, TGT_LEN + 1, 10000)]
+    dataset = PairDataset(src, tgt, EOS_token)
+    collate = PadCollate(PAD_token)
+
+    def run():
+        pairs = np.random.randint(len(dataset), size=case['batch'])
+        input_var, _, target_var, _ = collate([dataset[i] for i in pairs])
+        return input_var.to(device), target_var.to(device)
+    return run
+
+
+@contextlib.contextmanager
+def bench_build_dataset(case, device):
+    # 1000 articles of case['src'] words out of case['vocab'], tokenized,
+    # indexed and padded; utils reads them from its module-level paths, which
+    # are restored afterwards
+    import utils
+
+    words = ['w%d' % i for i in range(case['vocab'])]
+    word_dict = {'<padding>': 0, '<unk>': 1}
+    for word in words[:case['vocab'] // 2]:
+        word_dict[word] = len(word_dict)
+    saved_paths = utils.train_article_path, utils.train_title_path
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {}
+        for name, length in (('article', case['src']), ('title', TGT_LEN)):
+            paths[name] = os.path.join(directory, name + '.txt')
+            with open(paths[name], 'w') as f:
+                for _ in range(1000):
+                    f.write(' '.join(np.random.choice(words, length)) + '\n')
+        utils.train_article_path = paths['article']
+        utils.train_title_path = paths['title']
+        try:
+            # Fails early if the NLTK tokenizer data is missing
+            utils.build_dataset('train', word_dict, case['src'], TGT_LEN, toy=False)
+            yield lambda: utils.build_dataset('train', word_dict, case['src'], TGT_LEN, toy=False)
+        finally:
+            utils.train_article_path, utils.train_title_path = saved_paths
+
+
+# name -> (setup, grid parameters it depends on, runs under no_grad)
+BENCHMARKS = {
+    'attn_dot': (bench_attention('dot'), ('batch', 'src', 'hidden'), True),
+    'attn_general': (bench_attention('general'), ('batch', 'src', 'hidden'), True),
+    'attn_concat': (bench_attention('concat'), ('batch', 'src', 'hidden'), True),
+    'encoder': (bench_encoder, ('batch', 'src', 'hidden', 'vocab'), True),
+    'decoder_step': (bench_decoder_step, ('batch', 'src', 'hidden', 'vocab'), True),
+    'train_step': (bench_train_step, ('batch', 'src', 'hidden', 'vocab'), False),
+    'masked_cross_entropy': (bench_masked_cross_entropy, ('batch', 'vocab'), False),
+    'collate': (bench_collate, ('batch', 'src'), True),
+    'build_dataset': (bench_build_dataset, ('src', 'vocab'), True),
+}
+
+
+def cases(grid, params):
+    for values in itertools.product(*(grid[p] for p in params)):
+        yield dict(zip(params, values))
+
+
+def case_name(name, case):
+    return '%s[%s]' % (name, ','.join('%s=%d' % item for item in case.items()))
+
+
+# Seconds per call: the median (and min) over repeat measurements, each of
+# enough calls to take at least min_time
+def measure(run, device, repeat, min_time):
+    def timed(number):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        return time.perf_counter() - start
+
+    number = 1
+    while timed(number) < min_time:
+        number *= 2
+    times = [timed(number) / number for _ in range(repeat)]
+    return {'median': statistics.median(times), 'min': min(times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', default='.', help='regex selecting the benchmarks to run')
+    parser.add_argument('--quick', action='store_true', help='only the smallest case of every benchmark')
+    for param, values in GRID.items():
+        parser.add_argument('--%s' % param, type=int, nargs='+', help='grid values (default: %s)' % values)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per measurement')
+    parser.add_argument('--baseline', help='JSON file of results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='flag cases whose median is this fraction slower than the baseline')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--threads', type=int, default=1, help='CPU intra-op threads (steadier timings with 1)')
+    parser.add_argument('--cuda', action='store_true')
+    args = parser.parse_args()
+    configure_cpu(args.threads)
+    device = get_device(args.cuda)
+
+    grid = dict(QUICK_GRID if args.quick else GRID)
+    for param in GRID:
+        if getattr(args, param):
+            grid[param] = getattr(args, param)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    print('%-60s %12s %12s %8s' % ('case', 'median', 'baseline', 'change'))
+    for name, (setup, params, no_grad) in BENCHMARKS.items():
+        if not re.search(args.filter, name):
+            continue
+        for case in cases(grid, params):
+            key = case_name(name, case)
+            np.random.seed(2018)
+            torch.manual_seed(2018)
+            try:
+                with torch.set_grad_enabled(not no_grad), contextlib.ExitStack() as stack:
+                    run = setup(case, device)
+                    if isinstance(run, contextlib.AbstractContextManager):
+                        run = stack.enter_context(run)
+                    results[key] = measure(run, device, args.repeat, args.min_time)
+            except (ImportError, LookupError) as e:
+                # Optional dependencies (NLTK and its tokenizer data for build_dataset)
+                print('%-60s skipped: %s' % (key, str(e).strip().splitlines()[0]))
+                continue
+
+            median = results[key]['median']
+            line = '%-60s %10.3fms' % (key, median * 1000)
+            if key in baseline:
+                change = median / baseline[key]['median'] - 1
+                line += ' %10.3fms %+7.1f%%' % (baseline[key]['median'] * 1000, change * 100)
+                if change > args.threshold:
+                    regressions.append(key)
+                    line += '  REGRESSION'
+            print(line)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': {'torch': torch.__version__, 'python': platform.python_version(),
+                                'machine': platform.machine(), 'device': str(device),
+                                'threads': torch.get_num_threads()},
+                       'results': results}, f, indent=2, sort_keys=True)
+        print('Saved %d results to %s' % (len(results), args.save_baseline))
+    if regressions:
+        print('%d regression(s) beyond %.0f%%: %s' % (len(regressions), args.threshold * 100, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import os
+import random
+import re
+import threading
+import time
+
+import numpy as np
+import torch
+
+CHECKPOINT_DIR = './model'
+CHECKPOINT_PATTERN = re.compile(r'^checkpoint_(\d+)\.pkl$')
+
+
+# (step, path) of every checkpoint in directory, oldest first
+def list_checkpoints(directory=CHECKPOINT_DIR):
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = CHECKPOINT_PATTERN.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def latest_checkpoint(directory=CHECKPOINT_DIR):
+    found = list_checkpoints(directory)
+    return found[-1][1] if found else None
+
+
+def load_checkpoint(path):
+    # Checkpoints hold more than plain tensors (RNG and sampler states, or the
+    # packed int8 weights of quantize.py), so this needs the full unpickler
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+
+# Copy of state with every tensor detached and on the CPU, so training can go on
+# modifying the originals while the copy is written
+def cpu_snapshot(state):
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: cpu_snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(cpu_snapshot(value) for value in state)
+    return state
+
+
+def rng_state():
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class Checkpointer:
+    # Saves training state every every_steps steps and/or every_minutes minutes.
+    # save() only takes a CPU snapshot on the calling thread; the file is written
+    # on a background thread to a temporary name and renamed into place, so a
+    # crash never leaves a truncated checkpoint. Only the newest keep are kept
+    # (all of them with keep=0).
+    def __init__(self, directory=CHECKPOINT_DIR, every_steps=None, every_minutes=None, keep=3):
+        self.directory = directory
+        self.every_steps = every_steps
+        self.every_minutes = every_minutes
+        self.keep = keep
+        self.last_save = time.time()
+        self.last_step = None
+        self.thread = None
+        self.error = None
+        os.makedirs(directory, exist_ok=True)
+
+    def due(self, step):
+        if self.every_steps and step % self.every_steps == 0:
+            return True
+        return bool(self.every_minutes) and time.time() - self.last_save >= self.every_minutes * 60
+
+    def save(self, step, state):
+        # At most one write in flight, so at most one snapshot waits in memory
+        self.wait()
+        self.last_save = time.time()
+        self.last_step = step
+        self.thread = threading.Thread(target=self._write, args=(step, cpu_snapshot(state)))
+        self.thread.start()
+
+    # Blocks until the last write has finished, raising its error if it failed
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _write(self, step, state):
+        try:
+            path = os.path.join(self.directory, 'checkpoint_%08d.pkl' % step)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                torch.save(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            for _, old_path in list_checkpoints(self.directory)[:-self.keep]:
+                os.remove(old_path)
+        except Exception as e:
+            self.error = e
@@ -0,0 +1,35 @@
+import torch
+import torch.nn as nn
+
+
+# The device everything runs on: the GPU when asked for and present, else the CPU
+def get_device(use_cuda=True):
+    return torch.device('cuda' if use_cuda and torch.cuda.is_available() else 'cpu')
+
+
+# CPU tuning. Intra-op threads parallelize single ops (GRU, matmuls); inter-op
+# threads run independent ops concurrently and can only be set once, before
+# any parallel work has started, so call this at startup. None keeps PyTorch's
+# default (one thread per physical core).
+def configure_cpu(num_threads=None, interop_threads=None):
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        torch.set_num_interop_threads(interop_threads)
+
+
+# Moves a model to device and compacts every RNN's weights into one contiguous
+# block, which both cuDNN and the CPU GRU kernels expect
+def prepare_model(model, device):
+    model.to(device)
+    for module in model.modules():
+        if isinstance(module, nn.RNNBase):
+            module.flatten_parameters()
+    return model
+
+
+# Mixed precision for the forward passes and the loss (run backward outside it).
+# bfloat16 keeps fp32's exponent range, so gradients need no loss scaling;
+# the losses and beam scores upcast to fp32 before their softmax.
+def autocast(device, enabled=True):
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=enabled)
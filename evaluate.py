@@ -0,0 +1,106 @@
+import argparse
+import sys
+
+from checkpoint import CHECKPOINT_DIR, latest_checkpoint, load_checkpoint
+from device import get_device, configure_cpu
+from evaluator import Evaluator
+from lang import normalize_string
+from model import AdaptiveOutput
+from preprocess import COMPILED_DIR, load_corpus
+from rouge import fast_rouge_scores
+from trainer import load_models
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize sentences (one per line) with a trained model')
+    parser.add_argument('input', nargs='?', help='file to read sentences from (default: stdin)')
+    parser.add_argument('--checkpoint', help='checkpoint saved by train.py (default: the latest in --checkpoint-dir)')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    parser.add_argument('--quantized', help='int8 models exported by quantize.py, used instead of --checkpoint')
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+    parser.add_argument('--beam-size', type=int, default=0, help='beam search with this many hypotheses '
+                                                                 '(default: batched greedy decoding)')
+    parser.add_argument('--length-penalty', type=float, default=1.0)
+    parser.add_argument('--no-repeat-ngram-size', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-length', type=int, default=30)
+    parser.add_argument('--reference', help='file of reference summaries, one per input line, to report the '
+                                            'ROUGE-1/2/L of the output against (on stderr)')
+    parser.add_argument('--rouge-processes', type=int, help='processes scoring ROUGE (default: one per CPU)')
+    parser.add_argument('--shortlist', help='vocabulary shortlist built by shortlist.py (greedy decoding with a '
+                                            'dense output layer only)')
+    parser.add_argument('--bf16', action='store_true', help='decode under bfloat16 autocast')
+    parser.add_argument('--cpu', action='store_true')
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    parser.add_argument('--interop-threads', type=int, help='CPU inter-op threads')
+    return parser.parse_args(argv)
+
+
+# The int8 models of --quantized, or those of a checkpoint
+def models_from_args(args, input_lang, output_lang, device):
+    if args.quantized:
+        from quantize import load_quantized
+        return load_quantized(args.quantized, input_lang, output_lang)
+
+    checkpoint_path = args.checkpoint or latest_checkpoint(args.checkpoint_dir)
+    if checkpoint_path is None:
+        raise SystemExit('No checkpoint in %s' % args.checkpoint_dir)
+    return load_models(load_checkpoint(checkpoint_path), input_lang, output_lang, device)
+
+
+# Output-vocabulary ids of tokenized sentences. Words outside the vocabulary
+# are numbered from lang.n_words up (shared through oov), so they only match
+# themselves rather than every other unknown word.
+def word_ids(lang, sentences, oov):
+    return [[lang.word2index[word] if word in lang.word2index else oov.setdefault(word, lang.n_words + len(oov))
+             for word in words]
+            for words in sentences]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.quantized and args.bf16:
+        raise SystemExit('--bf16 needs fp32 weights; the --quantized models are int8')
+    configure_cpu(args.threads, args.interop_threads)
+    # The quantized models only run on the CPU
+    device = get_device(not (args.cpu or args.quantized))
+
+    input_lang, output_lang, _, _ = load_corpus(args.data_dir)
+    encoder, decoder = models_from_args(args, input_lang, output_lang, device)
+    if args.shortlist and isinstance(decoder.out, AdaptiveOutput):
+        raise SystemExit('--shortlist needs a dense output layer; this model uses an adaptive softmax')
+    evaluator = Evaluator(encoder, decoder, input_lang, output_lang, device, use_bf16=args.bf16)
+
+    with open(args.input) if args.input else sys.stdin as f:
+        sentences = [normalize_string(line) for line in f]
+    if args.beam_size:
+        decoded = []
+        for start in range(0, len(sentences), args.batch_size):
+            decoded.extend(evaluator.evaluate_beam(sentences[start:start + args.batch_size], args.beam_size,
+                                                   args.max_length, args.length_penalty,
+                                                   args.no_repeat_ngram_size))
+    else:
+        shortlist = None
+        if args.shortlist:
+            from shortlist import load_shortlist
+            shortlist = load_shortlist(args.shortlist)
+        decoded = evaluator.evaluate_batch(sentences, args.batch_size, args.max_length, shortlist)
+
+    decoded = [[word for word in words if word != '<EOS>'] for words in decoded]
+    for words in decoded:
+        print(' '.join(words))
+
+    if args.reference:
+        with open(args.reference) as f:
+            references = [normalize_string(line).split() for line in f]
+        if len(references) != len(decoded):
+            raise SystemExit('%d references for %d inputs' % (len(references), len(decoded)))
+        oov = {}
+        scores = fast_rouge_scores(word_ids(output_lang, decoded, oov), word_ids(output_lang, references, oov),
+                                   args.rouge_processes)
+        print('ROUGE-1 %.2f, ROUGE-2 %.2f, ROUGE-L %.2f' % (
+            100 * scores['rouge-1'], 100 * scores['rouge-2'], 100 * scores['rouge-l']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import contextlib
+import itertools
+import math
+import time
+
+import torch
+
+from device import autocast
+from inference import beam_search, greedy_decode
+from lang import PAD_token, SOS_token, EOS_token, UNK_token, indexes_from_words
+from preprocess import MAX_LENGTH
+from rouge import fast_rouge_scores
+from trainer import compute_loss
+
+
+class Evaluator:
+    # Decodes raw sentences with an encoder/decoder pair. Unknown words map to
+    # UNK and every output is a list of words, ending with '<EOS>' if the
+    # decoder emitted it.
+    def __init__(self, encoder, decoder, input_lang, output_lang, device, use_bf16=False):
+        self.encoder = encoder
+        self.decoder = decoder
+        self.input_lang = input_lang
+        self.output_lang = output_lang
+        self.device = device
+        self.use_bf16 = use_bf16
+
+    # No dropout, no autograd and optional bf16 while decoding; the models
+    # go back to the mode they were in afterwards
+    @contextlib.contextmanager
+    def decoding(self):
+        training = self.encoder.training, self.decoder.training
+        self.encoder.train(False)
+        self.decoder.train(False)
+        try:
+            with torch.no_grad(), autocast(self.device, self.use_bf16):
+                yield
+        finally:
+            self.encoder.train(training[0])
+            self.decoder.train(training[1])
+
+    def words(self, hypothesis):
+        return [self.output_lang.index2word[ni] if ni != EOS_token else '<EOS>' for ni in hypothesis]
+
+    # Greedy decoding of one sentence, also returning its attention weights
+    # (output words x input words) for show_attention
+    def evaluate(self, input_seq, max_length=MAX_LENGTH):
+        with self.decoding():
+            input_seqs = [indexes_from_words(self.input_lang, input_seq) + [EOS_token]]
+            input_lengths = [len(input_seqs[0])]
+            input_batches = torch.LongTensor(input_seqs).transpose(0, 1).to(self.device)
+
+            # Run through encoder
+            encoder_outputs, encoder_hidden = self.encoder(input_batches, input_lengths, None)
+            attn_keys = self.decoder.attn.precompute(encoder_outputs)
+
+            # Create starting vectors for decoder
+            decoder_input = torch.LongTensor([SOS_token]).to(self.device)  # SOS
+            decoder_hidden = encoder_hidden[:self.decoder.n_layers]  # Use last (forward) hidden state from encoder
+
+            # Store output words and attention states
+            decoded_words = []
+            decoder_attentions = torch.zeros(max_length + 1, max_length + 1)
+            # Run through decoder
+            for di in range(max_length):
+                decoder_output, decoder_hidden, decoder_attention = self.decoder(
+                    decoder_input, decoder_hidden, encoder_outputs, attn_keys
+                )
+
+                # Choose top word from output
+                topv, topi = decoder_output.data.topk(1)
+                ni = topi[0][0]
+                if ni == EOS_token:
+                    decoder_attentions[len(decoded_words), :decoder_attention.size(2)] += decoder_attention.squeeze(0).squeeze(0).cpu().data
+                    decoded_words.append('<EOS>')
+                    break
+                elif self.output_lang.index2word[ni.tolist()] not in decoded_words:
+                    decoder_attentions[len(decoded_words), :decoder_attention.size(2)] += decoder_attention.squeeze(0).squeeze(0).cpu().data
+                    decoded_words.append(self.output_lang.index2word[ni.tolist()])
+                else:
+                    continue
+
+                # Next input is chosen word
+                decoder_input = torch.LongTensor([ni.tolist()]).to(self.device)
+
+        return decoded_words, decoder_attentions[:len(decoded_words), :len(encoder_outputs)]
+
+    def input_batch_from_sentences(self, input_sentences):
+        input_seqs = [indexes_from_words(self.input_lang, sentence) + [EOS_token] for sentence in input_sentences]
+
+        # Sort by length (descending) for packing, remembering where each sentence came from
+        order = sorted(range(len(input_seqs)), key=lambda i: len(input_seqs[i]), reverse=True)
+        input_lengths = [len(input_seqs[i]) for i in order]
+        input_padded = [input_seqs[i] + [PAD_token] * (input_lengths[0] - len(input_seqs[i])) for i in order]
+        input_batches = torch.LongTensor(input_padded).transpose(0, 1).to(self.device)
+
+        return input_batches, input_lengths, order
+
+    def evaluate_beam(self, input_sentences, beam_size=5, max_length=MAX_LENGTH, length_penalty=1.0,
+                      no_repeat_ngram_size=3):
+        with self.decoding():
+            input_batches, input_lengths, order = self.input_batch_from_sentences(input_sentences)
+            hypotheses = beam_search(
+                self.encoder, self.decoder, input_batches, input_lengths, SOS_token, EOS_token, beam_size=beam_size,
+                max_length=max_length, length_penalty=length_penalty, no_repeat_ngram_size=no_repeat_ngram_size
+            )
+
+        decoded_words = [None] * len(input_sentences)
+        for i, hypothesis in zip(order, hypotheses):
+            decoded_words[i] = self.words(hypothesis)
+        return decoded_words
+
+    def evaluate_batch(self, input_sentences, batch_size=64, max_length=MAX_LENGTH, shortlist=None):
+        # Sort by length so every batch packs sequences of similar length
+        order = sorted(range(len(input_sentences)), key=lambda i: len(input_sentences[i].split()), reverse=True)
+        decoded_words = [None] * len(input_sentences)
+
+        with self.decoding():
+            for start in range(0, len(order), batch_size):
+                batch_order = order[start:start + batch_size]
+                input_batches, input_lengths, _ = self.input_batch_from_sentences(
+                    [input_sentences[i] for i in batch_order])
+                decoded = greedy_decode(self.encoder, self.decoder, input_batches, input_lengths, SOS_token,
+                                        EOS_token, max_length, shortlist)
+                for i, hypothesis in zip(batch_order, decoded):
+                    decoded_words[i] = self.words(hypothesis)
+
+        return decoded_words
+
+    # Teacher-forced masked loss, perplexity and ROUGE-1/2/L (of greedy decodes
+    # against the targets, on word ids) over batches from sorted_batches.
+    # Every UNK in the targets stands for a different unknown word, so each gets
+    # an id of its own past the vocabulary and never matches a decoded UNK (as
+    # with evaluate.py --reference). Stops after the batch that exceeds
+    # max_seconds, if given.
+    def validate(self, batches, max_length=30, max_seconds=None, loss_chunk_size=None):
+        start = time.time()
+        total_loss = 0.0
+        n_tokens = 0
+        hypotheses = []
+        references = []
+        unknown_ids = itertools.count(self.output_lang.n_words)
+        with self.decoding():
+            for input_batches, input_lengths, target_batches, target_lengths in batches:
+                input_batches = input_batches.to(self.device)
+                target_batches = target_batches.to(self.device)
+                loss = compute_loss(input_batches, input_lengths, target_batches, target_lengths,
+                                    self.encoder, self.decoder, loss_chunk_size=loss_chunk_size)
+                total_loss += loss.item() * sum(target_lengths)
+                n_tokens += sum(target_lengths)
+
+                decoded = greedy_decode(self.encoder, self.decoder, input_batches, input_lengths, SOS_token,
+                                        EOS_token, max_length)
+                hypotheses.extend(hypothesis[:-1] if hypothesis[-1:] == [EOS_token] else hypothesis
+                                  for hypothesis in decoded)
+                targets = target_batches.t().tolist()
+                references.extend([next(unknown_ids) if token == UNK_token else token for token in target[:length - 1]]
+                                  for target, length in zip(targets, target_lengths))
+                if max_seconds and time.time() - start > max_seconds:
+                    break
+
+        loss = total_loss / max(n_tokens, 1)
+        result = {'loss': loss, 'perplexity': math.exp(min(loss, 100)), 'sentences': len(hypotheses),
+                  'seconds': time.time() - start}
+        # Scored in this process: validation runs inside training, whose threads would not survive a fork
+        result.update(fast_rouge_scores(hypotheses, references, processes=1))
+        return result
@@ -0,0 +1,200 @@
+import time
+
+import torch
+import torch.nn.functional as F
+
+from model import AdaptiveOutput, attention_mask
+
+
+def block_repeated_ngrams(log_probs, tokens, ngram_size):
+    # Forbid every word that would complete an n-gram already in the hypothesis:
+    # the last word of each earlier n-gram whose first n - 1 words are the
+    # hypothesis' last n - 1. All rows at once, without leaving the device.
+    if tokens.size(1) < ngram_size:
+        return
+    ngrams = tokens.unfold(1, ngram_size, 1)  # rows x (T - n + 1) x n
+    prefix = tokens[:, tokens.size(1) - ngram_size + 1:]  # rows x (n - 1)
+    matches = ngrams[:, :, :-1].eq(prefix.unsqueeze(1)).all(2)
+    # Non-matching n-grams point at a spare column past the vocabulary
+    vocab_size = log_probs.size(1)
+    banned_words = ngrams[:, :, -1].masked_fill(~matches, vocab_size)
+    banned = torch.zeros(log_probs.size(0), vocab_size + 1, dtype=torch.bool, device=log_probs.device)
+    banned.scatter_(1, banned_words, True)
+    log_probs.masked_fill_(banned[:, :vocab_size], float('-inf'))
+
+
+def beam_search(encoder, decoder, input_batches, input_lengths, sos_token, eos_token, beam_size=5,
+                max_length=100, length_penalty=1.0, no_repeat_ngram_size=0):
+    """
+    Args:
+        encoder, decoder: An EncoderRNN and a LuongAttnDecoderRNN in eval mode.
+        input_batches: A LongTensor of size (max_len, batch) holding the
+            padded source sequences, sorted by length (descending).
+        input_lengths: A list of the source lengths.
+        beam_size: Number of hypotheses kept per source sequence.
+        length_penalty: Exponent alpha of the GNMT length penalty
+            ((5 + len) / 6) ** alpha; 0 ranks by raw log-probability.
+        no_repeat_ngram_size: Block repeated n-grams of this size (0 to disable).
+
+    Returns:
+        A list holding the best token sequence for each source sequence,
+        ending with eos_token unless max_length was reached first.
+    """
+    batch_size = input_batches.size(1)
+    device = input_batches.device
+
+    encoder_outputs, encoder_hidden = encoder(input_batches, input_lengths, None)
+    attn_keys = decoder.attn.precompute(encoder_outputs)
+    attn_mask = attention_mask(input_lengths, encoder_outputs)
+
+    # Hypotheses live in flat (batch * beam) tensors so each step is a single decoder call
+    encoder_outputs = encoder_outputs.repeat_interleave(beam_size, dim=1)
+    attn_keys = attn_keys.repeat_interleave(beam_size, dim=0)
+    attn_mask = attn_mask.repeat_interleave(beam_size, dim=0)
+    decoder_hidden = encoder_hidden[:decoder.n_layers].repeat_interleave(beam_size, dim=1)
+    tokens = torch.full((batch_size * beam_size, 1), sos_token, dtype=torch.long, device=device)
+
+    # All beams start out identical, so only the first one is live at step 0
+    scores = torch.full((batch_size, beam_size), float('-inf'), device=device)
+    scores[:, 0] = 0
+    scores = scores.view(-1)
+
+    active = list(range(batch_size))  # original batch index of every sentence still decoding
+    finished = [[] for _ in range(batch_size)]
+    beam_offsets = torch.arange(beam_size, device=device)
+
+    for step in range(max_length):
+        n_active = len(active)
+        decoder_output, decoder_hidden, _ = decoder(tokens[:, -1], decoder_hidden, encoder_outputs, attn_keys,
+                                                    attn_mask)
+        log_probs = F.log_softmax(decoder_output.float(), dim=1)
+        if no_repeat_ngram_size > 0:
+            block_repeated_ngrams(log_probs, tokens, no_repeat_ngram_size)
+
+        # Best 2 * beam_size continuations per sentence, so beam_size survive even if some end in EOS
+        vocab_size = log_probs.size(1)
+        candidates = (scores.unsqueeze(1) + log_probs).view(n_active, -1)
+        top_scores, top_ids = candidates.topk(2 * beam_size, dim=1)
+        top_beams = torch.div(top_ids, vocab_size, rounding_mode='floor')
+        top_words = top_ids % vocab_size
+
+        # EOS among the top beam_size candidates finishes a hypothesis
+        top_eos = top_words.eq(eos_token)
+        eos_mask = top_eos[:, :beam_size] & torch.isfinite(top_scores[:, :beam_size])
+        if eos_mask.any():
+            penalty = ((5.0 + step + 1) / 6.0) ** length_penalty
+            for i, k in eos_mask.nonzero().tolist():
+                row = i * beam_size + top_beams[i, k].item()
+                hypothesis = tokens[row, 1:].tolist() + [eos_token]
+                finished[active[i]].append((top_scores[i, k].item() / penalty, hypothesis))
+
+        # The best beam_size non-EOS candidates carry on
+        live_scores, live_pos = top_scores.masked_fill(top_eos, float('-inf')).topk(beam_size, dim=1)
+        live_beams = top_beams.gather(1, live_pos)
+        live_words = top_words.gather(1, live_pos)
+        rows = (torch.arange(n_active, device=device).unsqueeze(1) * beam_size + live_beams).view(-1)
+        tokens = torch.cat((tokens.index_select(0, rows), live_words.view(-1, 1)), 1)
+        decoder_hidden = decoder_hidden.index_select(1, rows)
+        scores = live_scores.view(-1)
+
+        # Prune sentences that already have beam_size finished hypotheses
+        keep = [i for i, b in enumerate(active) if len(finished[b]) < beam_size]
+        if len(keep) < n_active:
+            active = [active[i] for i in keep]
+            if not active:
+                break
+            rows = (torch.tensor(keep, device=device).unsqueeze(1) * beam_size + beam_offsets).view(-1)
+            tokens = tokens.index_select(0, rows)
+            decoder_hidden = decoder_hidden.index_select(1, rows)
+            encoder_outputs = encoder_outputs.index_select(1, rows)
+            attn_keys = attn_keys.index_select(0, rows)
+            attn_mask = attn_mask.index_select(0, rows)
+            scores = scores.index_select(0, rows)
+
+    # Sentences that hit max_length fall back on their live hypotheses
+    penalty = ((5.0 + tokens.size(1) - 1) / 6.0) ** length_penalty
+    for i, b in enumerate(active):
+        for row in range(i * beam_size, (i + 1) * beam_size):
+            if torch.isfinite(scores[row]):
+                finished[b].append((scores[row].item() / penalty, tokens[row, 1:].tolist()))
+
+    return [max(hypotheses, key=lambda h: h[0])[1] if hypotheses else [] for hypotheses in finished]
+
+
+# With a shortlist (see shortlist.py), only the output layer rows of the batch's
+# candidate words are scored instead of the full vocabulary. An AdaptiveOutput
+# picks each word with predict(), which skips the tail clusters it does not need.
+def greedy_decode(encoder, decoder, input_batches, input_lengths, sos_token, eos_token, max_length=100,
+                  shortlist=None):
+    batch_size = input_batches.size(1)
+    device = input_batches.device
+
+    encoder_outputs, encoder_hidden = encoder(input_batches, input_lengths, None)
+    attn_keys = decoder.attn.precompute(encoder_outputs)
+    attn_mask = attention_mask(input_lengths, encoder_outputs)
+    decoder_hidden = encoder_hidden[:decoder.n_layers]
+    decoder_input = torch.full((batch_size,), sos_token, dtype=torch.long, device=device)
+
+    adaptive = isinstance(decoder.out, AdaptiveOutput)
+    if shortlist is not None:
+        if adaptive:
+            raise ValueError('a shortlist needs the dense output layer, not an AdaptiveOutput')
+        candidates = shortlist.candidates(input_batches)
+        out_weight, out_bias = decoder.out.weight, decoder.out.bias
+        if callable(out_weight):
+            # Dynamically quantized Linear (see quantize.py)
+            out_weight, out_bias = out_weight().dequantize(), out_bias()
+        out_weight = out_weight.index_select(0, candidates)
+        out_bias = out_bias.index_select(0, candidates)
+
+    active = list(range(batch_size))  # original batch index of every sequence still decoding
+    decoded = [[] for _ in range(batch_size)]
+    for _ in range(max_length):
+        if shortlist is None and not adaptive:
+            decoder_output, decoder_hidden, _ = decoder(decoder_input, decoder_hidden, encoder_outputs, attn_keys,
+                                                        attn_mask)
+            decoder_input = decoder_output.argmax(1)
+        else:
+            features, decoder_hidden, _ = decoder.features(
+                decoder_input.view(1, -1), decoder_hidden, encoder_outputs, attn_keys, attn_mask)
+            if adaptive:
+                decoder_input = decoder.out.predict(features.squeeze(0))
+            else:
+                decoder_input = candidates[F.linear(features.squeeze(0), out_weight, out_bias).argmax(1)]
+        for b, ni in zip(active, decoder_input.tolist()):
+            decoded[b].append(ni)
+
+        # Sequences that emitted EOS leave the active set
+        live = decoder_input.ne(eos_token)
+        if not live.all():
+            keep = live.nonzero().squeeze(1)
+            active = [active[i] for i in keep.tolist()]
+            if not active:
+                break
+            decoder_input = decoder_input.index_select(0, keep)
+            decoder_hidden = decoder_hidden.index_select(1, keep)
+            encoder_outputs = encoder_outputs.index_select(1, keep)
+            attn_keys = attn_keys.index_select(0, keep)
+            attn_mask = attn_mask.index_select(0, keep)
+
+    return decoded
+
+
+# Greedy decodes of (input_batches, input_lengths, ...) batches, and the seconds they took
+def decode_batches(encoder, decoder, batches, sos_token, eos_token, max_length=100, shortlist=None):
+    decoded = []
+    start = time.time()
+    with torch.no_grad():
+        for batch in batches:
+            decoded.extend(greedy_decode(encoder, decoder, batch[0], batch[1], sos_token, eos_token, max_length,
+                                         shortlist))
+    return decoded, time.time() - start
+
+
+# Fractions of the sequences in two decodes of the same inputs that are
+# identical, and of their tokens that agree position by position
+def agreement(decoded, reference):
+    same_sequences = sum(a == b for a, b in zip(decoded, reference))
+    same_tokens = sum(x == y for a, b in zip(decoded, reference) for x, y in zip(a, b))
+    total_tokens = sum(max(len(a), len(b)) for a, b in zip(decoded, reference))
+    return float(same_sequences) / max(len(reference), 1), float(same_tokens) / max(total_tokens, 1)
@@ -0,0 +1,95 @@
+import unicodedata
+
+from token_store import read_vocab, write_vocab
+
+PAD_token = 0
+SOS_token = 1
+EOS_token = 2
+UNK_token = 3
+
+
+class Lang:
+    def __init__(self, name):
+        self.name = name
+        self.trimmed = False
+        self.word2index = {"PAD": 0, "SOS": 1, "EOS": 2, "UNK": 3}
+        self.word2count = {}
+        self.index2word = {0: "PAD", 1: "SOS", 2: "EOS", 3: "UNK"}
+        self.n_words = 4  # Count default tokens
+
+    def index_words(self, sentence):
+        for word in sentence.split():
+            self.index_word(word)
+
+    def index_word(self, word):
+        if word not in self.word2index:
+            self.word2index[word] = self.n_words
+            self.word2count[word] = 1
+            self.index2word[self.n_words] = word
+            self.n_words += 1
+        else:
+            self.word2count[word] += 1
+
+    # Remove words below a certain count threshold
+    def trim(self, min_count):
+        if self.trimmed:
+            return
+        self.trimmed = True
+
+        keep_words = []
+
+        for k, v in self.word2count.items():
+            if v >= min_count:
+                keep_words.append(k)
+
+        print('keep_words %s / %s = %.4f' % (
+            len(keep_words), len(self.word2index), len(keep_words) / len(self.word2index)
+        ))
+
+        # Reinitialize dictionaries, keeping the counts of the surviving words
+        word2count = self.word2count
+        self.word2index = {"PAD": 0, "SOS": 1, "EOS": 2, "UNK": 3}
+        self.word2count = {}
+        self.index2word = {0: "PAD", 1: "SOS", 2: "EOS", 3: "UNK"}
+        self.n_words = 4  # Count default tokens
+
+        for word in keep_words:
+            self.index_word(word)
+            self.word2count[word] = word2count[word]
+
+    def save_vocab(self, path):
+        words = [self.index2word[i] for i in range(4, self.n_words)]
+        write_vocab(path, words, [self.word2count[word] for word in words])
+
+    def load_vocab(self, path):
+        words, counts = read_vocab(path)
+        for word, count in zip(words, counts):
+            self.index_word(word)
+            self.word2count[word] = count
+        self.trimmed = True
+
+
+# Turn a Unicode string to plain ASCII, thanks to http://stackoverflow.com/a/518232/2809427
+def unicode_to_ascii(s):
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', s)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+
+# Lowercase, trim, and remove non-letter characters
+def normalize_string(s):
+    s = unicode_to_ascii(s.lower().strip())
+    # s = re.sub(r"([.!?])", r" \1", s)
+    # s = re.sub(r"[^a-zA-Z.!?]+", r" ", s)
+    s = s.replace('<unk>', 'unk')
+    return s
+
+
+# Return a list of indexes, one for each word in the sentence (UNK for unknown words)
+def indexes_from_words(lang, sentence):
+    return [lang.word2index.get(word, UNK_token) for word in sentence.split()]
+
+
+def sentence_from_indexes(lang, indexes):
+    return ' '.join(lang.index2word[int(i)] for i in indexes)
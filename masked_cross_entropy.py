@@ -1,23 +1,20 @@
 import torch
 from torch.nn import functional
-from torch.autograd import Variable
+from torch.utils.checkpoint import checkpoint
 
 def sequence_mask(sequence_length, max_len=None):
     if max_len is None:
         max_len = sequence_length.data.max()
     batch_size = sequence_length.size(0)
-    seq_range = torch.arange(0, max_len).long()
+    seq_range = torch.arange(0, max_len, device=sequence_length.device).long()
     seq_range_expand = seq_range.unsqueeze(0).expand(batch_size, max_len)
-    seq_range_expand = Variable(seq_range_expand)
-    if sequence_length.is_cuda:
-        seq_range_expand = seq_range_expand.cuda()
     seq_length_expand = (sequence_length.unsqueeze(1)
                          .expand_as(seq_range_expand))
     return seq_range_expand < seq_length_expand
 
 
 def masked_cross_entropy(logits, target, length):
-    length = Variable(torch.LongTensor(length)).cuda()
+    length = torch.LongTensor(length).to(logits.device)
 
     """
     Args:
@@ -36,8 +33,8 @@ def masked_cross_entropy(logits, target, length):
 
     # logits_flat: (batch * max_len, num_classes)
     logits_flat = logits.view(-1, logits.size(-1))
-    # log_probs_flat: (batch * max_len, num_classes)
-    log_probs_flat = functional.log_softmax(logits_flat, dim=1)
+    # log_probs_flat: (batch * max_len, num_classes), in fp32 also under autocast
+    log_probs_flat = functional.log_softmax(logits_flat.float(), dim=1)
     # target_flat: (batch * max_len, 1)
     target_flat = target.view(-1, 1)
     # losses_flat: (batch * max_len, 1)
@@ -49,3 +46,55 @@ def masked_cross_entropy(logits, target, length):
     losses = losses * mask.float()
     loss = losses.sum() / length.float().sum()
     return loss
+
+
+def _chunk_nll(features, target, weight, bias):
+    log_probs = functional.log_softmax(functional.linear(features, weight, bias).float(), dim=1)
+    return -torch.gather(log_probs, dim=1, index=target.unsqueeze(1)).sum()
+
+
+def chunked_masked_cross_entropy(features, weight, bias, target, length, chunk_size=1024):
+    """
+    Args:
+        features: A FloatTensor of size (max_len, batch, hidden) holding
+            the decoder outputs before the output layer.
+        weight, bias: The output layer, mapping hidden to num_classes.
+        target: A LongTensor of size (max_len, batch) which contains the
+            index of the true class for each corresponding step.
+        length: A list which contains the length of each data in a batch.
+        chunk_size: Number of positions whose logits exist at a time.
+
+    Returns:
+        loss: The same average loss as masked_cross_entropy, but the logits
+            are only computed for unpadded positions, chunk_size at a time
+            and recomputed in backward, so the full (max_len, batch,
+            num_classes) tensor is never held in memory.
+    """
+    length = torch.LongTensor(length).to(target.device)
+    # mask: (max_len, batch), so the kept positions stay in time order
+    mask = sequence_mask(sequence_length=length, max_len=target.size(0)).t()
+    features = features[mask]
+    target = target[mask]
+
+    loss = 0
+    for start in range(0, target.size(0), chunk_size):
+        loss = loss + checkpoint(_chunk_nll, features[start:start + chunk_size], target[start:start + chunk_size],
+                                 weight, bias, use_reentrant=False)
+    return loss / target.size(0)
+
+
+def masked_adaptive_cross_entropy(features, output_layer, target, length):
+    """
+    Args:
+        features: A FloatTensor of size (max_len, batch, hidden) holding
+            the decoder outputs before the output layer.
+        output_layer: An AdaptiveOutput.
+        target: A LongTensor of size (max_len, batch).
+        length: A list which contains the length of each data in a batch.
+
+    Returns:
+        loss: The average adaptive softmax loss over the unpadded positions.
+    """
+    length = torch.LongTensor(length).to(target.device)
+    mask = sequence_mask(sequence_length=length, max_len=target.size(0)).t()
+    return output_layer.loss(features[mask], target[mask])
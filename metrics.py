@@ -0,0 +1,120 @@
+import collections
+import contextlib
+import json
+import os
+import resource
+import time
+
+import torch
+
+from batching import padding_ratio
+
+METRICS_FILE = './model/metrics.jsonl'
+
+
+class Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.synchronize()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.synchronize()
+        self.timer.totals[self.name] += time.perf_counter() - self.start
+
+
+class PhaseTimer:
+    # Wall time per named phase of the training step. GPU work is asynchronous,
+    # so on CUDA every phase boundary synchronizes. A disabled timer hands out
+    # one shared no-op context, so the instrumented code costs next to nothing.
+    def __init__(self, enabled=True, device=None):
+        self.enabled = enabled
+        self.cuda = device is not None and device.type == 'cuda'
+        self.totals = collections.defaultdict(float)
+
+    def synchronize(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    # Seconds per phase since the last call
+    def pop(self):
+        totals = dict(self.totals)
+        self.totals.clear()
+        return totals
+
+
+NULL_PHASE = contextlib.nullcontext()
+NULL_TIMER = PhaseTimer(enabled=False)
+
+
+# Peak memory in MB: the process's resident set size since it started and,
+# on CUDA, what the caching allocator handed out since the last call
+def peak_memory(device):
+    memory = {'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10}
+    if device.type == 'cuda':
+        memory['peak_cuda_allocated_mb'] = torch.cuda.max_memory_allocated(device) / 2 ** 20
+        memory['peak_cuda_reserved_mb'] = torch.cuda.max_memory_reserved(device) / 2 ** 20
+        torch.cuda.reset_peak_memory_stats(device)
+    return memory
+
+
+class MetricsLog:
+    # Training metrics over intervals of steps, one JSON line per interval:
+    # loss, seconds per step in each phase of timer, source and target
+    # tokens/sec (without padding), padding ratio and peak memory
+    def __init__(self, path, timer, device):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'a')
+        self.timer = timer
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        self.start = time.time()
+        self.steps = 0
+        self.loss = 0.0
+        self.batches = 0
+        self.src_tokens = 0
+        self.tgt_tokens = 0
+        self.padding = 0.0
+        self.timer.pop()
+
+    def batch(self, input_lengths, target_lengths):
+        self.batches += 1
+        self.src_tokens += sum(input_lengths)
+        self.tgt_tokens += sum(target_lengths)
+        self.padding += padding_ratio(input_lengths, target_lengths)
+
+    def step(self, loss):
+        self.steps += 1
+        self.loss += loss
+
+    def write(self, step):
+        elapsed = time.time() - self.start
+        record = {
+            'step': step,
+            'time': time.time(),
+            'loss': self.loss / max(self.steps, 1),
+            'steps_per_sec': self.steps / elapsed,
+            'src_tokens_per_sec': self.src_tokens / elapsed,
+            'tgt_tokens_per_sec': self.tgt_tokens / elapsed,
+            'padding': self.padding / max(self.batches, 1),
+            'phases': {name: seconds / max(self.steps, 1) for name, seconds in self.timer.pop().items()},
+        }
+        record.update(peak_memory(self.device))
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.reset()
+        return record
+
+    def close(self):
+        self.file.close()
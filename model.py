@@ -0,0 +1,259 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from profiling import label
+
+# Energy of padded source positions: low enough that their attention weight
+# underflows to 0, but finite (even in bfloat16), so their log weight times the
+# zero encoder output at that position still adds 0 to the context
+MASKED_ENERGY = -1e4
+
+
+# True at the padded positions of each source sequence (B x 1 x S), for
+# Attn.forward to keep them out of the softmax so a sequence's attention does
+# not depend on how long its batch-mates are
+def attention_mask(input_lengths, encoder_outputs):
+    lengths = torch.as_tensor(input_lengths, device=encoder_outputs.device)
+    positions = torch.arange(encoder_outputs.size(0), device=encoder_outputs.device)
+    return (positions.unsqueeze(0) >= lengths.unsqueeze(1)).unsqueeze(1)
+
+
+class EncoderRNN(nn.Module):
+    def __init__(self, input_size, embedding_size, hidden_size, n_layers=1, dropout=0.1, pre_word_embeds=None):
+        super(EncoderRNN, self).__init__()
+
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.n_layers = n_layers
+        self.dropout = dropout
+        self.embedding = nn.Embedding(input_size, embedding_size)
+        if pre_word_embeds is not None:
+            self.embedding.weight = nn.Parameter(torch.FloatTensor(pre_word_embeds))
+        self.gru = nn.GRU(embedding_size, hidden_size, n_layers, dropout=self.dropout, bidirectional=True)
+
+    def forward(self, input_seqs, input_lengths, hidden=None):
+        # Note: we run this all at once (over multiple batches of multiple sequences)
+        with label('EncoderRNN'):
+            embedded = self.embedding(input_seqs)
+            packed = torch.nn.utils.rnn.pack_padded_sequence(embedded, input_lengths)
+            outputs, hidden = self.gru(packed, hidden)
+            outputs, output_lengths = torch.nn.utils.rnn.pad_packed_sequence(outputs)  # unpack (back to padded)
+            outputs = outputs[:, :, :self.hidden_size] + outputs[:, :, self.hidden_size:]  # Sum bidirectional outputs
+        return outputs, hidden
+
+
+class Attn(nn.Module):
+    def __init__(self, method, hidden_size):
+        super(Attn, self).__init__()
+
+        self.method = method
+        self.hidden_size = hidden_size
+
+        if self.method == 'general':
+            self.attn = nn.Linear(self.hidden_size, hidden_size)
+
+        elif self.method == 'concat':
+            self.attn = nn.Linear(self.hidden_size * 2, hidden_size)
+            self.v = nn.Parameter(torch.FloatTensor(1, hidden_size))
+
+    # The encoder side of the energies only depends on encoder_outputs, so it is
+    # computed once per batch and passed back in as keys on every decoder step.
+    # Keys are made contiguous once here rather than by bmm on every step
+    def precompute(self, encoder_outputs):
+        if self.method == 'dot':
+            return encoder_outputs.permute(1, 2, 0).contiguous()  # B x N x S
+
+        elif self.method == 'general':
+            return self.attn(encoder_outputs).permute(1, 2, 0).contiguous()  # B x N x S
+
+        elif self.method == 'concat':
+            # The score has no nonlinearity, so v . W[h; e] splits into a decoder and an
+            # encoder term and the encoder term is a single energy per source position
+            encoder_energy = F.linear(encoder_outputs, self.v.mm(self.attn.weight[:, self.hidden_size:]),
+                                      self.v.mv(self.attn.bias))  # S x B x 1
+            return encoder_energy.permute(1, 2, 0).contiguous()  # B x 1 x S
+
+    def forward(self, hidden, encoder_outputs, keys=None, mask=None):
+        # Score all encoder outputs (S x B x N) against T decoder states (T x B x N,
+        # T = 1 when decoding step by step) with batched ops instead of per-cell score()
+        with label('Attn'):
+            if keys is None:
+                keys = self.precompute(encoder_outputs)
+
+            if self.method in ('dot', 'general'):
+                attn_energies = torch.bmm(hidden.transpose(0, 1), keys)
+
+            elif self.method == 'concat':
+                hidden_energy = F.linear(hidden, self.v.mm(self.attn.weight[:, :self.hidden_size]))  # T x B x 1
+                attn_energies = hidden_energy.permute(1, 0, 2) + keys
+
+            if mask is not None:
+                attn_energies = attn_energies.masked_fill(mask, MASKED_ENERGY)
+
+            # Normalize energies to weights in range 0 to 1, B x T x S
+            return F.log_softmax(attn_energies, dim=2)
+
+    # Energy of a single (1 x N) decoder state / encoder output pair, kept as
+    # the reference for the batched computation in forward()
+    def score(self, hidden, encoder_output):
+
+        if self.method == 'dot':
+            energy = torch.dot(hidden.view(-1), encoder_output.view(-1))
+            return energy
+
+        elif self.method == 'general':
+            energy = self.attn(encoder_output)
+            energy = torch.dot(hidden.view(-1), energy.view(-1))
+            return energy
+
+        elif self.method == 'concat':
+            energy = self.attn(torch.cat((hidden, encoder_output), 1))
+            energy = torch.dot(self.v.view(-1), energy.view(-1))
+            return energy
+
+
+class BahdanauAttnDecoderRNN(nn.Module):
+    def __init__(self, hidden_size, output_size, n_layers=1, dropout_p=0.1):
+        super(BahdanauAttnDecoderRNN, self).__init__()
+
+        # Define parameters
+        self.hidden_size = hidden_size
+        self.output_size = output_size
+        self.n_layers = n_layers
+        self.dropout_p = dropout_p
+        self.max_length = max_length
+
+        # Define layers
+        self.embedding = nn.Embedding(output_size, hidden_size)
+        self.dropout = nn.Dropout(dropout_p)
+        self.attn = Attn('concat', hidden_size)
+        self.gru = nn.GRU(hidden_size, hidden_size, n_layers, dropout=dropout_p)
+        self.out = nn.Linear(hidden_size, output_size)
+
+    def forward(self, word_input, last_hidden, encoder_outputs):
+        # Note: we run this one step at a time
+        # TODO: FIX BATCHING
+
+        # Get the embedding of the current input word (last output word)
+        word_embedded = self.embedding(word_input).view(1, 1, -1)  # S=1 x B x N
+        word_embedded = self.dropout(word_embedded)
+
+        # Calculate attention weights and apply to encoder outputs
+        attn_weights = self.attn(last_hidden[-1], encoder_outputs)
+        context = attn_weights.bmm(encoder_outputs.transpose(0, 1))  # B x 1 x N
+        context = context.transpose(0, 1)  # 1 x B x N
+
+        # Combine embedded input word and attended context, run through RNN
+        rnn_input = torch.cat((word_embedded, context), 2)
+        output, hidden = self.gru(rnn_input, last_hidden)
+
+        # Final output layer
+        output = output.squeeze(0)  # B x N
+        output = F.log_softmax(self.out(torch.cat((output, context), 1)))
+
+        # Return final output, hidden state, and attention weights (for visualization)
+        return output, hidden, attn_weights
+
+
+class AdaptiveOutput(nn.Module):
+    # Frequency-bucketed adaptive softmax (Grave et al.) as a drop-in for the
+    # decoder's dense output layer. The clusters of nn.AdaptiveLogSoftmaxWithLoss
+    # are ranges of class ids, so word ids are mapped to frequency ranks first
+    def __init__(self, hidden_size, word_counts, cutoffs, div_value=4.0):
+        super(AdaptiveOutput, self).__init__()
+
+        order = sorted(range(len(word_counts)), key=lambda i: -word_counts[i])
+        rank = [0] * len(order)
+        for r, i in enumerate(order):
+            rank[i] = r
+        self.register_buffer('order', torch.LongTensor(order))  # rank -> word id
+        self.register_buffer('rank', torch.LongTensor(rank))  # word id -> rank
+        self.adaptive = nn.AdaptiveLogSoftmaxWithLoss(hidden_size, len(order), cutoffs, div_value=div_value)
+
+    def forward(self, features):
+        # Exact log-probabilities over the full vocabulary, in word id order
+        log_probs = self.adaptive.log_prob(features.reshape(-1, features.size(-1)))
+        return log_probs.index_select(1, self.rank).view(*features.shape[:-1], -1)
+
+    # Mean negative log-likelihood of target (N) given features (N x hidden)
+    def loss(self, features, target):
+        return self.adaptive(features, self.rank[target]).loss
+
+    # Most likely word ids, without scoring the whole vocabulary
+    def predict(self, features):
+        return self.order[self.adaptive.predict(features)]
+
+
+class LuongAttnDecoderRNN(nn.Module):
+    # output_layer replaces the dense self.out (e.g. an AdaptiveOutput)
+    def __init__(self, attn_model, embedding_size, hidden_size, output_size, n_layers=1, dropout=0.1, pre_word_embeds=None,
+                 output_layer=None):
+        super(LuongAttnDecoderRNN, self).__init__()
+
+        # Keep for reference
+        self.attn_model = attn_model
+        self.hidden_size = hidden_size
+        self.output_size = output_size
+        self.n_layers = n_layers
+        self.dropout = dropout
+        self.embedding_size = embedding_size
+        # Define layers
+        self.embedding = nn.Embedding(output_size, embedding_size)
+        if pre_word_embeds is not None:
+            self.embedding.weight = nn.Parameter(torch.FloatTensor(pre_word_embeds))
+        self.embedding_dropout = nn.Dropout(dropout)
+        self.gru = nn.GRU(embedding_size, hidden_size, n_layers, dropout=dropout)
+        self.concat = nn.Linear(hidden_size * 2, hidden_size)
+        self.out = output_layer if output_layer is not None else nn.Linear(hidden_size, output_size)
+
+        # Choose attention model
+        if attn_model != 'none':
+            self.attn = Attn(attn_model, hidden_size)
+
+    # attn_keys (from self.attn.precompute(encoder_outputs)) lets a decode loop
+    # compute the encoder side of the attention once instead of on every step;
+    # attn_mask (from attention_mask) keeps padded source positions out of it
+    def forward(self, input_seq, last_hidden, encoder_outputs, attn_keys=None, attn_mask=None):
+        # Note: we run this one step at a time
+        with label('LuongAttnDecoderRNN.step'):
+            output, hidden, attn_weights = self.forward_sequence(
+                input_seq.view(1, -1), last_hidden, encoder_outputs, attn_keys, attn_mask)
+        return output.squeeze(0), hidden, attn_weights
+
+    def forward_sequence(self, input_seqs, last_hidden, encoder_outputs, attn_keys=None, attn_mask=None):
+        # Teacher forcing: all T input words (T x B) are known up front, so the GRU
+        # runs over the whole sequence in one call and attention, concat and out
+        # are computed for every step at once
+        concat_output, hidden, attn_weights = self.features(input_seqs, last_hidden, encoder_outputs, attn_keys,
+                                                            attn_mask)
+
+        # Finally predict next tokens (Luong eq. 6, without softmax)
+        with label('output layer'):
+            output = self.out(concat_output)  # T x B x V
+
+        # Return final outputs, hidden state, and attention weights (for visualization)
+        return output, hidden, attn_weights
+
+    # Everything up to the output layer, for losses that apply self.out themselves
+    def features(self, input_seqs, last_hidden, encoder_outputs, attn_keys=None, attn_mask=None):
+        with label('LuongAttnDecoderRNN'):
+
+            # Get the embeddings of the input words
+            embedded = self.embedding(input_seqs)
+            embedded = self.embedding_dropout(embedded)  # T x B x N
+
+            # Get the hidden states from the input words and last hidden state
+            rnn_output, hidden = self.gru(embedded, last_hidden)
+
+            # Calculate attention from the RNN states and all encoder outputs;
+            # apply to encoder outputs to get weighted averages
+            attn_weights = self.attn(rnn_output, encoder_outputs, attn_keys, attn_mask)  # B x T x S
+            context = attn_weights.bmm(encoder_outputs.transpose(0, 1)).transpose(0, 1)  # T x B x N
+
+            # Attentional vectors using the RNN hidden states and context vectors
+            # concatenated together (Luong eq. 5)
+            concat_input = torch.cat((rnn_output, context), 2)
+            concat_output = torch.tanh(self.concat(concat_input))  # T x B x N
+
+        return concat_output, hidden, attn_weights
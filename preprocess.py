@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+
+from lang import Lang, normalize_string, indexes_from_words
+from token_store import TokenArrayWriter, TokenArray
+
+COMPILED_DIR = './data/compiled'
+MIN_LENGTH = 5
+MAX_LENGTH = 200
+MIN_COUNT = 1
+
+
+def read_langs(lang1, lang2, reverse=False):
+    print("Reading lines...")
+
+    # Read the file and split into lines
+#     filename = '../data/%s-%s.txt' % (lang1, lang2)
+    filename = './data/%s-%s.txt' % (lang1, lang2)
+    src_file = './data/train.src'
+    tgt_file = './data/train.tgt'
+    src = [normalize_string(s) for s in open(src_file).readlines()[:10000]]
+    tgt = [normalize_string(s) for s in open(tgt_file).readlines()[:10000]]
+    pairs = [[src[i], tgt[i]] for i in range(len(src))]
+    # Reverse pairs, make Lang instances
+    if reverse:
+        pairs = [list(reversed(p)) for p in pairs]
+        input_lang = Lang(lang2)
+        output_lang = Lang(lang1)
+    else:
+        input_lang = Lang(lang1)
+        output_lang = Lang(lang2)
+
+    return input_lang, output_lang, pairs
+
+
+def filter_pairs(pairs):
+    filtered_pairs = []
+    for pair in pairs:
+        if MIN_LENGTH <= len(pair[0]) <= MAX_LENGTH and MIN_LENGTH <= len(pair[1]) <= MAX_LENGTH:
+            filtered_pairs.append(pair)
+    return filtered_pairs
+
+
+def prepare_data(lang1_name, lang2_name, reverse=False):
+    input_lang, output_lang, pairs = read_langs(lang1_name, lang2_name, reverse)
+    print("Read %d sentence pairs" % len(pairs))
+
+    pairs = filter_pairs(pairs)
+    print("Filtered to %d pairs" % len(pairs))
+
+    print("Indexing words...")
+    for pair in pairs:
+        input_lang.index_words(pair[0])
+        output_lang.index_words(pair[1])
+
+    print('Indexed %d words in input language, %d words in output' % (input_lang.n_words, output_lang.n_words))
+    return input_lang, output_lang, pairs
+
+
+def prepare_valid_data(valid_article, valid_title):
+    va = open(valid_article).readlines()
+    vt = open(valid_title).readlines()
+    va = [normalize_string(s) for s in va]
+    vt = [normalize_string(s) for s in vt]
+    valid_pairs = [[va[i], vt[i]] for i in range(len(vt))]
+    return valid_pairs
+
+
+def write_pairs(path, input_lang, output_lang, pairs):
+    # Words trimmed from the vocabulary are stored as UNK
+    with TokenArrayWriter(path + '.src') as src, TokenArrayWriter(path + '.tgt') as tgt:
+        for pair in pairs:
+            src.append(indexes_from_words(input_lang, pair[0]))
+            tgt.append(indexes_from_words(output_lang, pair[1]))
+
+
+def compile_corpus(out_dir=COMPILED_DIR):
+    input_lang, output_lang, pairs = prepare_data('art', 'tit', False)
+    valid_pairs = prepare_valid_data('./data/valid.src', './data/valid.tgt')
+    input_lang.trim(MIN_COUNT)
+    output_lang.trim(MIN_COUNT)
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    input_lang.save_vocab(os.path.join(out_dir, 'input.vocab'))
+    output_lang.save_vocab(os.path.join(out_dir, 'output.vocab'))
+    write_pairs(os.path.join(out_dir, 'train'), input_lang, output_lang, pairs)
+    write_pairs(os.path.join(out_dir, 'valid'), input_lang, output_lang, valid_pairs)
+
+    # Written last, so a half-finished compile is never picked up
+    meta = {'input_lang': input_lang.name, 'output_lang': output_lang.name,
+            'train_pairs': len(pairs), 'valid_pairs': len(valid_pairs)}
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    print('Compiled %d train and %d valid pairs to %s' % (len(pairs), len(valid_pairs), out_dir))
+
+
+def is_compiled(data_dir=COMPILED_DIR):
+    return os.path.exists(os.path.join(data_dir, 'meta.json'))
+
+
+def load_corpus(data_dir=COMPILED_DIR):
+    with open(os.path.join(data_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    input_lang = Lang(meta['input_lang'])
+    input_lang.load_vocab(os.path.join(data_dir, 'input.vocab'))
+    output_lang = Lang(meta['output_lang'])
+    output_lang.load_vocab(os.path.join(data_dir, 'output.vocab'))
+
+    train_pairs = (TokenArray(os.path.join(data_dir, 'train.src')), TokenArray(os.path.join(data_dir, 'train.tgt')))
+    valid_pairs = (TokenArray(os.path.join(data_dir, 'valid.src')), TokenArray(os.path.join(data_dir, 'valid.tgt')))
+    return input_lang, output_lang, train_pairs, valid_pairs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile ./data/train.* and ./data/valid.* into token arrays')
+    parser.add_argument('--out-dir', default=COMPILED_DIR)
+    args = parser.parse_args()
+    compile_corpus(args.out_dir)
@@ -0,0 +1,43 @@
+import contextlib
+import os
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function, schedule
+
+PROFILE_DIR = './model/profile'
+NULL_LABEL = contextlib.nullcontext()
+
+
+# record_function(name) while a profiler is recording, otherwise one shared
+# no-op context, so the labelled regions cost next to nothing in normal runs
+def label(name):
+    if torch.autograd._profiler_enabled():
+        return record_function(name)
+    return NULL_LABEL
+
+
+# A torch.profiler that, driven by calling step() after every training step,
+# skips wait steps, warms up for warmup steps and records the next active
+# steps. The capture is then written to directory as a Chrome trace
+# (chrome://tracing or https://ui.perfetto.dev) and a table of the row_limit
+# most expensive operators. The EncoderRNN, Attn, LuongAttnDecoderRNN(.step),
+# output layer and loss regions are labelled (see label).
+def make_profiler(directory=PROFILE_DIR, device=torch.device('cpu'), wait=0, warmup=3, active=5, row_limit=30):
+    os.makedirs(directory, exist_ok=True)
+    activities = [ProfilerActivity.CPU]
+    sort_by = 'self_cpu_time_total'
+    if device.type == 'cuda':
+        activities.append(ProfilerActivity.CUDA)
+        sort_by = 'self_cuda_time_total'
+
+    def on_trace_ready(prof):
+        trace_path = os.path.join(directory, 'trace_%d.json' % prof.step_num)
+        prof.export_chrome_trace(trace_path)
+        table = prof.key_averages().table(sort_by=sort_by, row_limit=row_limit)
+        with open(os.path.join(directory, 'top_ops_%d.txt' % prof.step_num), 'w') as f:
+            f.write(table + '\n')
+        print(table)
+        print('Wrote %s' % trace_path)
+
+    return profile(activities=activities, schedule=schedule(wait=wait, warmup=warmup, active=active, repeat=1),
+                   on_trace_ready=on_trace_ready, record_shapes=True)
@@ -0,0 +1,110 @@
+import argparse
+import io
+import os
+
+import torch
+import torch.nn as nn
+
+from batching import PairDataset, sorted_batches
+from checkpoint import CHECKPOINT_DIR, latest_checkpoint, load_checkpoint
+from device import configure_cpu
+from inference import agreement, decode_batches
+from lang import PAD_token, SOS_token, EOS_token
+from model import Attn
+from preprocess import COMPILED_DIR, load_corpus
+from trainer import build_models, load_models
+
+QUANTIZED_FILE = './model/quantized.pkl'
+
+
+# Submodules stored in int8: every GRU and Linear (the decoder's concat, out or
+# the adaptive softmax's head and tail, and general attn). The concat attention reads its Linear's weight directly to
+# split the score, so that one stays in float, as do the embeddings.
+def quantizable_layers(model):
+    skip = set('%s.attn' % name for name, module in model.named_modules()
+               if isinstance(module, Attn) and module.method == 'concat')
+    return set(name for name, module in model.named_modules()
+               if isinstance(module, (nn.GRU, nn.Linear)) and name not in skip)
+
+
+# Dynamically quantized copy of model for CPU inference: weights are int8 and
+# activations are quantized on the fly, so no calibration data is needed
+def quantize(model):
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, quantizable_layers(model), dtype=torch.qint8)
+
+
+# config is the model configuration of the checkpoint (see train.py)
+def save_quantized(path, encoder, decoder, config):
+    torch.save({'config': config, 'encoder': encoder.state_dict(), 'decoder': decoder.state_dict()}, path)
+
+
+# Quantized (encoder, decoder) for the vocabularies of the compiled corpus, in
+# eval mode, ready for beam_search / greedy_decode on the CPU
+def load_quantized(path, input_lang, output_lang):
+    state = load_checkpoint(path)
+    encoder, decoder = build_models(input_lang, output_lang, **state['config'])
+    encoder, decoder = quantize(encoder), quantize(decoder)
+    encoder.load_state_dict(state['encoder'])
+    decoder.load_state_dict(state['decoder'])
+    return encoder, decoder
+
+
+# Serialized size of a model's weights in MB
+def model_size(model):
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export int8 dynamically quantized models and compare them '
+                                                 'against fp32 on the validation pairs')
+    parser.add_argument('--checkpoint', help='checkpoint saved by train.py (default: the latest in --checkpoint-dir)')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    parser.add_argument('--out', default=QUANTIZED_FILE)
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-length', type=int, default=30)
+    parser.add_argument('--max-sentences', type=int, default=2000)
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    parser.add_argument('--interop-threads', type=int, help='CPU inter-op threads')
+    args = parser.parse_args()
+    configure_cpu(args.threads, args.interop_threads)
+
+    checkpoint_path = args.checkpoint or latest_checkpoint(args.checkpoint_dir)
+    if checkpoint_path is None:
+        parser.error('no checkpoint in %s' % args.checkpoint_dir)
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    input_lang, output_lang, _, (valid_src, valid_tgt) = load_corpus(args.data_dir)
+    encoder, decoder = load_models(checkpoint, input_lang, output_lang)
+    encoder.eval()
+    decoder.eval()
+
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    save_quantized(args.out, quantize(encoder), quantize(decoder), checkpoint['config'])
+    q_encoder, q_decoder = load_quantized(args.out, input_lang, output_lang)
+    print('Saved quantized models to %s' % args.out)
+
+    batches = list(sorted_batches(PairDataset(valid_src, valid_tgt, EOS_token), args.batch_size, PAD_token,
+                                  args.max_sentences))
+    n = sum(len(batch[1]) for batch in batches)
+    decode_batches(encoder, decoder, batches[:1], SOS_token, EOS_token, args.max_length)  # Warm up
+    decode_batches(q_encoder, q_decoder, batches[:1], SOS_token, EOS_token, args.max_length)
+    full, full_time = decode_batches(encoder, decoder, batches, SOS_token, EOS_token, args.max_length)
+    fast, fast_time = decode_batches(q_encoder, q_decoder, batches, SOS_token, EOS_token, args.max_length)
+
+    full_size = model_size(encoder) + model_size(decoder)
+    fast_size = model_size(q_encoder) + model_size(q_decoder)
+    same_sequences, same_tokens = agreement(fast, full)
+    print('%d validation sentences, %d CPU threads' % (n, torch.get_num_threads()))
+    print('fp32 %8.1f MB %8.2fs  %8.1f sentences/s' % (full_size, full_time, n / full_time))
+    print('int8 %8.1f MB %8.2fs  %8.1f sentences/s  (%.2fx smaller, %.2fx faster)' % (
+        fast_size, fast_time, n / fast_time, full_size / fast_size, full_time / fast_time))
+    print('agreement: %.1f%% of sentences, %.1f%% of tokens' % (100 * same_sequences, 100 * same_tokens))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import collections
+import multiprocessing
+
+import numpy as np
+
+
+def ngrams(tokens, n):
+    return collections.Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def f1(overlap, hypothesis_count, reference_count):
+    if overlap == 0:
+        return 0.0
+    precision = float(overlap) / hypothesis_count
+    recall = float(overlap) / reference_count
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_n(hypothesis, reference, n):
+    hypothesis_ngrams = ngrams(hypothesis, n)
+    reference_ngrams = ngrams(reference, n)
+    overlap = sum((hypothesis_ngrams & reference_ngrams).values())
+    return f1(overlap, sum(hypothesis_ngrams.values()), sum(reference_ngrams.values()))
+
+
+def lcs_length(a, b):
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def rouge_l(hypothesis, reference):
+    return f1(lcs_length(hypothesis, reference), len(hypothesis), len(reference))
+
+
+# Pure-Python reference implementation; fast_rouge_scores gives the same
+# scores for word ids
+def rouge_scores(hypotheses, references):
+    """
+    Args:
+        hypotheses: Token sequences (lists of word ids or words) to score.
+        references: One reference token sequence per hypothesis.
+
+    Returns:
+        A dict of the mean ROUGE-1, ROUGE-2 and ROUGE-L F1 scores.
+    """
+    totals = {'rouge-1': 0.0, 'rouge-2': 0.0, 'rouge-l': 0.0}
+    for hypothesis, reference in zip(hypotheses, references):
+        totals['rouge-1'] += rouge_n(hypothesis, reference, 1)
+        totals['rouge-2'] += rouge_n(hypothesis, reference, 2)
+        totals['rouge-l'] += rouge_l(hypothesis, reference)
+    return {name: total / max(len(hypotheses), 1) for name, total in totals.items()}
+
+
+# Concatenated token ids of sequences as int64, with the offset and length of each
+def flatten(sequences):
+    lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    tokens = np.fromiter((token for sequence in sequences for token in sequence), np.int64, int(offsets[-1]))
+    return tokens, offsets, lengths
+
+
+# Every n-gram of the flattened sequences as one integer, sequence * base ** n
+# plus the n ids in base `base`, so equal keys are the same n-gram in the same
+# sequence. Exact (no collisions) while the keys fit in int64.
+def ngram_keys(tokens, offsets, lengths, n, base):
+    starts = np.arange(len(tokens) - n + 1, dtype=np.int64)
+    sequence = np.searchsorted(offsets, starts, side='right') - 1
+    complete = starts + n <= offsets[sequence + 1]
+    starts = starts[complete]
+    keys = sequence[complete]
+    for k in range(n):
+        keys = keys * base + tokens[starts + k]
+    return keys
+
+
+def ngram_overlaps(hypotheses, references, n, base):
+    # Clipped n-gram matches per pair: the smaller count of every n-gram both sides share
+    h_keys, h_counts = np.unique(ngram_keys(*hypotheses, n, base), return_counts=True)
+    r_keys, r_counts = np.unique(ngram_keys(*references, n, base), return_counts=True)
+    keys, h_index, r_index = np.intersect1d(h_keys, r_keys, assume_unique=True, return_indices=True)
+    overlaps = np.minimum(h_counts[h_index], r_counts[r_index])
+    return np.bincount(keys // base ** n, weights=overlaps, minlength=len(hypotheses[2]))
+
+
+def lcs_lengths(hypotheses, references):
+    # The row-by-row LCS table of every pair at once, padded hypotheses against
+    # padded references (pads never match). With t[j] the diagonal + 1 on a
+    # match and the cell above otherwise, each row is the running maximum of t.
+    padded = []
+    for (tokens, offsets, lengths), pad in ((hypotheses, -1), (references, -2)):
+        matrix = np.full((len(lengths), max(lengths.max(initial=0), 1)), pad, dtype=np.int64)
+        matrix[np.arange(len(lengths)).repeat(lengths), np.arange(len(tokens)) - offsets[:-1].repeat(lengths)] = tokens
+        padded.append(matrix)
+    h_matrix, r_matrix = padded
+    previous = np.zeros((len(h_matrix), r_matrix.shape[1] + 1), dtype=np.int64)
+    for i in range(h_matrix.shape[1]):
+        match = h_matrix[:, i:i + 1] == r_matrix
+        current = np.where(match, previous[:, :-1] + 1, previous[:, 1:])
+        np.maximum.accumulate(current, axis=1, out=current)
+        previous[:, 1:] = current
+    return previous[:, -1]
+
+
+def f1_scores(overlaps, hypothesis_counts, reference_counts):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = 2 * overlaps / (hypothesis_counts + reference_counts)
+    return np.where(overlaps > 0, scores, 0.0)
+
+
+def rouge_sums(pairs):
+    # Pool worker: sums of the ROUGE-1, ROUGE-2 and ROUGE-L F1 scores of a
+    # chunk of (hypotheses, references), split further while the n-gram keys
+    # would overflow int64
+    hypotheses, references = pairs
+    h = flatten(hypotheses)
+    r = flatten(references)
+    base = int(max(h[0].max(initial=0), r[0].max(initial=0))) + 1
+    if len(hypotheses) * base ** 2 >= 2 ** 63:
+        if len(hypotheses) == 1:
+            raise ValueError('token ids up to %d are too large to hash' % (base - 1))
+        half = len(hypotheses) // 2
+        first = rouge_sums((hypotheses[:half], references[:half]))
+        second = rouge_sums((hypotheses[half:], references[half:]))
+        return {name: first[name] + second[name] for name in first}
+
+    sums = {}
+    for n in (1, 2):
+        sums['rouge-%d' % n] = f1_scores(ngram_overlaps(h, r, n, base), np.maximum(h[2] - n + 1, 0),
+                                         np.maximum(r[2] - n + 1, 0)).sum()
+    sums['rouge-l'] = f1_scores(lcs_lengths(h, r), h[2], r[2]).sum()
+    return sums
+
+
+def fast_rouge_scores(hypotheses, references, processes=None, chunk_size=5000):
+    """
+    Args:
+        hypotheses: Sequences of non-negative integer token ids (e.g. decoder output) to score.
+        references: One reference sequence of token ids per hypothesis.
+        processes: Worker processes for the chunks (default: one per CPU, 1 scores
+            in this process).
+        chunk_size: Pairs scored together by one worker.
+
+    Returns:
+        A dict of the mean ROUGE-1, ROUGE-2 and ROUGE-L F1 scores.
+    """
+    chunks = [(hypotheses[i:i + chunk_size], references[i:i + chunk_size])
+              for i in range(0, len(hypotheses), chunk_size)]
+    if len(chunks) > 1 and processes != 1:
+        with multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(chunks))) as pool:
+            chunk_sums = pool.map(rouge_sums, chunks)
+    else:
+        chunk_sums = [rouge_sums(chunk) for chunk in chunks]
+    return {name: float(sum(sums[name] for sums in chunk_sums)) / max(len(hypotheses), 1)
+            for name in ('rouge-1', 'rouge-2', 'rouge-l')}
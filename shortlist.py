@@ -0,0 +1,82 @@
+import argparse
+import collections
+import os
+import time
+
+import numpy as np
+import torch
+
+from lang import EOS_token, UNK_token
+from preprocess import COMPILED_DIR, load_corpus
+
+SHORTLIST_FILE = './model/shortlist.npz'
+
+
+class Shortlist:
+    # Candidate output words for decoding a batch: the source words themselves
+    # (mapped into the output vocabulary), the most frequent target words and,
+    # for every source word, the target words it co-occurs with most often in
+    # the training pairs. Scoring only these rows of the output layer is much
+    # cheaper than scoring the full vocabulary at every step.
+    def __init__(self, src_to_tgt, translations, frequent):
+        self.src_to_tgt = src_to_tgt  # input word id -> output word id, -1 if none
+        self.translations = translations  # input word id -> output word ids, padded with -1
+        self.frequent = frequent
+
+    def candidates(self, input_batches):
+        src = np.unique(input_batches.cpu().numpy())
+        words = np.concatenate([self.frequent, self.src_to_tgt[src], self.translations[src].ravel()])
+        words = np.unique(words[words >= 0])
+        return torch.from_numpy(words).to(input_batches.device)
+
+    def save(self, path):
+        np.savez(path, src_to_tgt=self.src_to_tgt, translations=self.translations, frequent=self.frequent)
+
+
+def load_shortlist(path):
+    arrays = np.load(path)
+    return Shortlist(arrays['src_to_tgt'], arrays['translations'], arrays['frequent'])
+
+
+def build_shortlist(input_lang, output_lang, train_src, train_tgt, top_k=1000, translations_per_word=10):
+    src_to_tgt = np.full(input_lang.n_words, -1, dtype=np.int64)
+    for i in range(input_lang.n_words):
+        src_to_tgt[i] = output_lang.word2index.get(input_lang.index2word[i], -1)
+
+    words = sorted(output_lang.word2count, key=lambda w: -output_lang.word2count[w])[:top_k]
+    frequent = np.array([EOS_token, UNK_token] + [output_lang.word2index[w] for w in words], dtype=np.int64)
+
+    # Co-occurrence table; frequent words are always candidates, so they are left out
+    skip = set(frequent.tolist())
+    cooccurrences = collections.defaultdict(collections.Counter)
+    for pair in range(len(train_src)):
+        tgt = set(train_tgt[pair].tolist()) - skip
+        if tgt:
+            for src in set(train_src[pair].tolist()):
+                cooccurrences[src].update(tgt)
+
+    translations = np.full((input_lang.n_words, translations_per_word), -1, dtype=np.int64)
+    for src, counter in cooccurrences.items():
+        tgt = [word for word, _ in counter.most_common(translations_per_word)]
+        translations[src, :len(tgt)] = tgt
+
+    return Shortlist(src_to_tgt, translations, frequent)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a vocabulary shortlist from the compiled training pairs '
+                                                 'for evaluate.py --shortlist')
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+    parser.add_argument('--out', default=SHORTLIST_FILE)
+    parser.add_argument('--top-k', type=int, default=1000, help='most frequent target words, always candidates')
+    parser.add_argument('--translations', type=int, default=10,
+                        help='target words most often co-occurring with each source word')
+    args = parser.parse_args()
+
+    start = time.time()
+    input_lang, output_lang, (train_src, train_tgt), _ = load_corpus(args.data_dir)
+    shortlist = build_shortlist(input_lang, output_lang, train_src, train_tgt, args.top_k, args.translations)
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    shortlist.save(args.out)
+    print('Saved shortlist of %d pairs to %s (%.1fs)' % (len(train_src), args.out, time.time() - start))
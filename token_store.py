@@ -0,0 +1,72 @@
+# Flat on-disk token arrays: every sequence of a corpus is stored back to back
+# in <path>.tokens (int32) and located through <path>.offsets (int64, n + 1
+# entries), so a compiled corpus is memory-mapped instead of re-parsed.
+import numpy as np
+from array import array
+
+
+class TokenArrayWriter:
+    def __init__(self, path):
+        self.path = path
+        self.tokens = open(path + '.tokens', 'wb')
+        self.offsets = array('q', [0])
+
+    def append(self, seq):
+        seq = np.asarray(seq, dtype=np.int32)
+        seq.tofile(self.tokens)
+        self.offsets.append(self.offsets[-1] + len(seq))
+
+    def close(self):
+        self.tokens.close()
+        np.asarray(self.offsets, dtype=np.int64).tofile(self.path + '.offsets')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TokenArray:
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.memmap(path + '.offsets', dtype=np.int64, mode='r')
+        if self.offsets[-1] > 0:
+            self.tokens = np.memmap(path + '.tokens', dtype=np.int32, mode='r')
+        else:
+            self.tokens = np.zeros(0, dtype=np.int32)  # mmap cannot map an empty file
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    # Reopen the memory maps instead of pickling their contents (DataLoader workers)
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+def write_vocab(path, words, counts=None):
+    if counts is None:
+        counts = [0] * len(words)
+    with open(path, 'w', encoding='utf-8') as f:
+        for word, count in zip(words, counts):
+            f.write('%s\t%d\n' % (word, count))
+
+
+def read_vocab(path):
+    words = []
+    counts = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            word, count = line.rstrip('\n').split('\t')
+            words.append(word)
+            counts.append(int(count))
+    return words, counts
@@ -1,549 +1,32 @@
-import unicodedata
-import string
-import re
-import random
-import time
-import datetime
+import argparse
 import math
-import socket
-import codecs
-import torch
-import torch.nn as nn
-from torch.autograd import Variable
-from torch import optim
-import torch.nn.functional as F
-from torch.nn.utils.rnn import pad_packed_sequence, pack_padded_sequence
-from masked_cross_entropy import *
-from utils import get_init_embedding
-import matplotlib.pyplot as plt
-plt.rcParams['font.family'] = 'SimHei'
-plt.switch_backend('agg')
-import matplotlib.ticker as ticker
-import numpy as np
 import os
-os.environ["CUDA_VISIBLE_DEVICES"] = "0"
-
-random.seed(2018)
-torch.manual_seed(2018)
-hostname = socket.gethostname()
-USE_CUDA = True
-
-PAD_token = 0
-SOS_token = 1
-EOS_token = 2
-UNK_token = 3
-
-
-class Lang:
-    def __init__(self, name):
-        self.name = name
-        self.trimmed = False
-        self.word2index = {"PAD": 0, "SOS": 1, "EOS": 2, "UNK": 3}
-        self.word2count = {}
-        self.index2word = {0: "PAD", 1: "SOS", 2: "EOS", 3: "UNK"}
-        self.n_words = 4  # Count default tokens
-
-    def index_words(self, sentence):
-        for word in sentence.split():
-            self.index_word(word)
-
-    def index_word(self, word):
-        if word not in self.word2index:
-            self.word2index[word] = self.n_words
-            self.word2count[word] = 1
-            self.index2word[self.n_words] = word
-            self.n_words += 1
-        else:
-            self.word2count[word] += 1
-
-    # Remove words below a certain count threshold
-    def trim(self, min_count):
-        if self.trimmed:
-            return
-        self.trimmed = True
-
-        keep_words = []
-
-        for k, v in self.word2count.items():
-            if v >= min_count:
-                keep_words.append(k)
-
-        print('keep_words %s / %s = %.4f' % (
-            len(keep_words), len(self.word2index), len(keep_words) / len(self.word2index)
-        ))
-
-        # Reinitialize dictionaries
-        self.word2index = {"PAD": 0, "SOS": 1, "EOS": 2, "UNK": 3}
-        self.word2count = {}
-        self.index2word = {0: "PAD", 1: "SOS", 2: "EOS", 3: "UNK"}
-        self.n_words = 4  # Count default tokens
-
-        for word in keep_words:
-            self.index_word(word)
-
-
-# Turn a Unicode string to plain ASCII, thanks to http://stackoverflow.com/a/518232/2809427
-def unicode_to_ascii(s):
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', s)
-        if unicodedata.category(c) != 'Mn'
-    )
-
-
-# Lowercase, trim, and remove non-letter characters
-def normalize_string(s):
-    s = unicode_to_ascii(s.lower().strip())
-    # s = re.sub(r"([.!?])", r" \1", s)
-    # s = re.sub(r"[^a-zA-Z.!?]+", r" ", s)
-    s = s.replace('<unk>', 'unk')
-    return s
-
-
-def read_langs(lang1, lang2, reverse=False):
-    print("Reading lines...")
-
-    # Read the file and split into lines
-#     filename = '../data/%s-%s.txt' % (lang1, lang2)
-    filename = './data/%s-%s.txt' % (lang1, lang2)
-    src_file = './data/train.src'
-    tgt_file = './data/train.tgt'
-    src = [normalize_string(s) for s in open(src_file).readlines()[:10000]]
-    tgt = [normalize_string(s) for s in open(tgt_file).readlines()[:10000]]
-    pairs = [[src[i], tgt[i]] for i in range(len(src))]
-    # Reverse pairs, make Lang instances
-    if reverse:
-        pairs = [list(reversed(p)) for p in pairs]
-        input_lang = Lang(lang2)
-        output_lang = Lang(lang1)
-    else:
-        input_lang = Lang(lang1)
-        output_lang = Lang(lang2)
-
-    return input_lang, output_lang, pairs
-
-
-MIN_LENGTH = 5
-MAX_LENGTH = 200
-
-
-def filter_pairs(pairs):
-    filtered_pairs = []
-    for pair in pairs:
-        if MIN_LENGTH <= len(pair[0]) <= MAX_LENGTH and MIN_LENGTH <= len(pair[1]) <= MAX_LENGTH:
-            filtered_pairs.append(pair)
-    return filtered_pairs
-
-
-def prepare_data(lang1_name, lang2_name, reverse=False):
-    input_lang, output_lang, pairs = read_langs(lang1_name, lang2_name, reverse)
-    print("Read %d sentence pairs" % len(pairs))
-
-    pairs = filter_pairs(pairs)
-    print("Filtered to %d pairs" % len(pairs))
-
-    print("Indexing words...")
-    for pair in pairs:
-        input_lang.index_words(pair[0])
-        output_lang.index_words(pair[1])
-
-    print('Indexed %d words in input language, %d words in output' % (input_lang.n_words, output_lang.n_words))
-    return input_lang, output_lang, pairs
-
-
-def prepare_valid_data(valid_article, valid_title):
-    va = open(valid_article).readlines()
-    vt = open(valid_title).readlines()
-    va = [normalize_string(s) for s in va]
-    vt = [normalize_string(s) for s in vt]
-    valid_pairs = [[va[i], vt[i]] for i in range(len(vt))]
-    return valid_pairs
-
-
-input_lang, output_lang, pairs = prepare_data('art', 'tit', False)
-valid_pairs = prepare_valid_data('./data/valid.src', './data/valid.tgt')
-MIN_COUNT = 1
-input_lang.trim(MIN_COUNT)
-output_lang.trim(MIN_COUNT)
-keep_pairs = []
-
-for pair in pairs:
-    input_sentence = pair[0].split()
-    output_sentence = pair[1].split()
-    for i in range(len(input_sentence)):
-        if input_sentence[i] not in input_lang.word2index:
-            input_sentence[i] = "UNK"
-    for i in range(len(output_sentence)):
-        if output_sentence[i] not in output_lang.word2index:
-            output_sentence[i] = "UNK"
-    keep_pairs.append([" ".join(input_sentence), " ".join(output_sentence)])
-
-print("Trimmed from %d pairs to %d, %.4f of total" % (len(pairs), len(keep_pairs), len(keep_pairs) / len(pairs)))
-pairs = keep_pairs
-# input_lang_embedding = get_init_embedding(input_lang)
-input_lang_embedding = None
-# output_lang_embedding = get_init_embedding(output_lang)
-output_lang_embedding = None
-
-
-# Return a list of indexes, one for each word in the sentence, plus EOS
-def indexes_from_sentence(lang, sentence):
-    return [lang.word2index[word] for word in sentence.split(' ')] + [EOS_token]
-
-
-# Pad a with the PAD symbol
-def pad_seq(seq, max_length):
-    seq += [PAD_token for i in range(max_length - len(seq))]
-    return seq
-
-
-def random_batch(batch_size):
-    input_seqs = []
-    target_seqs = []
-
-    # Choose random pairs
-    for i in range(batch_size):
-        pair = random.choice(pairs)
-        input_seqs.append(indexes_from_sentence(input_lang, pair[0]))
-        target_seqs.append(indexes_from_sentence(output_lang, pair[1]))
-
-    # Zip into pairs, sort by length (descending), unzip
-    seq_pairs = sorted(zip(input_seqs, target_seqs), key=lambda p: len(p[0]), reverse=True)
-    input_seqs, target_seqs = zip(*seq_pairs)
-
-    # For input and target sequences, get array of lengths and pad with 0s to max length
-    input_lengths = [len(s) for s in input_seqs]
-    input_padded = [pad_seq(s, max(input_lengths)) for s in input_seqs]
-    target_lengths = [len(s) for s in target_seqs]
-    target_padded = [pad_seq(s, max(target_lengths)) for s in target_seqs]
-
-    # Turn padded arrays into (batch_size x max_len) tensors, transpose into (max_len x batch_size)
-    input_var = Variable(torch.LongTensor(input_padded)).transpose(0, 1)
-    target_var = Variable(torch.LongTensor(target_padded)).transpose(0, 1)
-
-    if USE_CUDA:
-        input_var = input_var.cuda()
-        target_var = target_var.cuda()
-
-    return input_var, input_lengths, target_var, target_lengths
-
-
-print(random_batch(2))
-
-
-class EncoderRNN(nn.Module):
-    def __init__(self, input_size, embedding_size, hidden_size, n_layers=1, dropout=0.1, pre_word_embeds=None):
-        super(EncoderRNN, self).__init__()
-
-        self.input_size = input_size
-        self.hidden_size = hidden_size
-        self.n_layers = n_layers
-        self.dropout = dropout
-        self.embedding = nn.Embedding(input_size, embedding_size)
-        if pre_word_embeds is not None:
-            self.embedding.weight = nn.Parameter(torch.FloatTensor(pre_word_embeds))
-        self.gru = nn.GRU(embedding_size, hidden_size, n_layers, dropout=self.dropout, bidirectional=True)
-
-    def forward(self, input_seqs, input_lengths, hidden=None):
-        # Note: we run this all at once (over multiple batches of multiple sequences)
-        embedded = self.embedding(input_seqs)
-        packed = torch.nn.utils.rnn.pack_padded_sequence(embedded, input_lengths)
-        outputs, hidden = self.gru(packed, hidden)
-        outputs, output_lengths = torch.nn.utils.rnn.pad_packed_sequence(outputs)  # unpack (back to padded)
-        outputs = outputs[:, :, :self.hidden_size] + outputs[:, :, self.hidden_size:]  # Sum bidirectional outputs
-        return outputs, hidden
-
-
-class Attn(nn.Module):
-    def __init__(self, method, hidden_size):
-        super(Attn, self).__init__()
-
-        self.method = method
-        self.hidden_size = hidden_size
-
-        if self.method == 'general':
-            self.attn = nn.Linear(self.hidden_size, hidden_size)
-
-        elif self.method == 'concat':
-            self.attn = nn.Linear(self.hidden_size * 2, hidden_size)
-            self.v = nn.Parameter(torch.FloatTensor(1, hidden_size))
-
-    def forward(self, hidden, encoder_outputs):
-        max_len = encoder_outputs.size(0)
-        this_batch_size = encoder_outputs.size(1)
-
-        # Create variable to store attention energies
-        attn_energies = Variable(torch.zeros(this_batch_size, max_len))  # B x S
-
-        if USE_CUDA:
-            attn_energies = attn_energies.cuda()
-
-        # For each batch of encoder outputs
-        for b in range(this_batch_size):
-            # Calculate energy for each encoder output
-            for i in range(max_len):
-                attn_energies[b, i] = self.score(hidden[:, b], encoder_outputs[i, b].unsqueeze(0))
-
-        # Normalize energies to weights in range 0 to 1, resize to 1 x B x S
-        return F.log_softmax(attn_energies, dim=1).unsqueeze(1)
-
-    def score(self, hidden, encoder_output):
-
-        if self.method == 'dot':
-            energy = torch.dot(hidden.view(-1), encoder_output.view(-1))
-            return energy
-
-        elif self.method == 'general':
-            energy = self.attn(encoder_output)
-            energy = torch.dot(hidden.view(-1), energy.view(-1))
-            return energy
-
-        elif self.method == 'concat':
-            energy = self.attn(torch.cat((hidden, encoder_output), 1))
-            energy = torch.dot(self.v.view(-1), energy.view(-1))
-            return energy
-
-
-class BahdanauAttnDecoderRNN(nn.Module):
-    def __init__(self, hidden_size, output_size, n_layers=1, dropout_p=0.1):
-        super(BahdanauAttnDecoderRNN, self).__init__()
-
-        # Define parameters
-        self.hidden_size = hidden_size
-        self.output_size = output_size
-        self.n_layers = n_layers
-        self.dropout_p = dropout_p
-        self.max_length = max_length
-
-        # Define layers
-        self.embedding = nn.Embedding(output_size, hidden_size)
-        self.dropout = nn.Dropout(dropout_p)
-        self.attn = Attn('concat', hidden_size)
-        self.gru = nn.GRU(hidden_size, hidden_size, n_layers, dropout=dropout_p)
-        self.out = nn.Linear(hidden_size, output_size)
+import random
+import subprocess
+import sys
+import time
 
-    def forward(self, word_input, last_hidden, encoder_outputs):
-        # Note: we run this one step at a time
-        # TODO: FIX BATCHING
+import torch
 
-        # Get the embedding of the current input word (last output word)
-        word_embedded = self.embedding(word_input).view(1, 1, -1)  # S=1 x B x N
-        word_embedded = self.dropout(word_embedded)
+from batching import BucketBatchSampler, PairDataset, BatchStream, make_loader, padding_ratio
+from checkpoint import CHECKPOINT_DIR, Checkpointer, latest_checkpoint, load_checkpoint, rng_state, set_rng_state
+from device import get_device, configure_cpu, prepare_model
+from evaluator import Evaluator
+from lang import PAD_token, EOS_token, sentence_from_indexes
+from metrics import METRICS_FILE, MetricsLog, PhaseTimer
+from preprocess import COMPILED_DIR, is_compiled, compile_corpus, load_corpus
+from profiling import PROFILE_DIR, make_profiler
+from trainer import Trainer, build_models
+from validate import RESULTS_FILE, format_result, validation_batches
+from visualize import ATTENTION_DIR, LocalSink, VisdomSink, VisualizationWorker, evaluate_and_show_attention
 
-        # Calculate attention weights and apply to encoder outputs
-        attn_weights = self.attn(last_hidden[-1], encoder_outputs)
-        context = attn_weights.bmm(encoder_outputs.transpose(0, 1))  # B x 1 x N
-        context = context.transpose(0, 1)  # 1 x B x N
-
-        # Combine embedded input word and attended context, run through RNN
-        rnn_input = torch.cat((word_embedded, context), 2)
-        output, hidden = self.gru(rnn_input, last_hidden)
-
-        # Final output layer
-        output = output.squeeze(0)  # B x N
-        output = F.log_softmax(self.out(torch.cat((output, context), 1)))
-
-        # Return final output, hidden state, and attention weights (for visualization)
-        return output, hidden, attn_weights
-
-
-class LuongAttnDecoderRNN(nn.Module):
-    def __init__(self, attn_model, embedding_size, hidden_size, output_size, n_layers=1, dropout=0.1, pre_word_embeds=None):
-        super(LuongAttnDecoderRNN, self).__init__()
-
-        # Keep for reference
-        self.attn_model = attn_model
-        self.hidden_size = hidden_size
-        self.output_size = output_size
-        self.n_layers = n_layers
-        self.dropout = dropout
-        self.embedding_size = embedding_size
-        # Define layers
-        self.embedding = nn.Embedding(output_size, embedding_size)
-        if pre_word_embeds is not None:
-            self.embedding.weight = nn.Parameter(torch.FloatTensor(pre_word_embeds))
-        self.embedding_dropout = nn.Dropout(dropout)
-        self.gru = nn.GRU(embedding_size, hidden_size, n_layers, dropout=dropout)
-        self.concat = nn.Linear(hidden_size * 2, hidden_size)
-        self.out = nn.Linear(hidden_size, output_size)
-
-        # Choose attention model
-        if attn_model != 'none':
-            self.attn = Attn(attn_model, hidden_size)
-
-    def forward(self, input_seq, last_hidden, encoder_outputs):
-        # Note: we run this one step at a time
-
-        # Get the embedding of the current input word (last output word)
-        batch_size = input_seq.size(0)
-        embedded = self.embedding(input_seq)
-        embedded = self.embedding_dropout(embedded)
-        embedded = embedded.view(1, batch_size, self.embedding_size)  # S=1 x B x N
-
-        # Get current hidden state from input word and last hidden state
-        rnn_output, hidden = self.gru(embedded, last_hidden)
-
-        # Calculate attention from current RNN state and all encoder outputs;
-        # apply to encoder outputs to get weighted average
-        attn_weights = self.attn(rnn_output, encoder_outputs)
-        context = attn_weights.bmm(encoder_outputs.transpose(0, 1))  # B x S=1 x N
-
-        # Attentional vector using the RNN hidden state and context vector
-        # concatenated together (Luong eq. 5)
-        rnn_output = rnn_output.squeeze(0)  # S=1 x B x N -> B x N
-        context = context.squeeze(1)  # B x S=1 x N -> B x N
-        concat_input = torch.cat((rnn_output, context), 1)
-        concat_output = torch.tanh(self.concat(concat_input))
-
-        # Finally predict next token (Luong eq. 6, without softmax)
-        output = self.out(concat_output)
-
-        # Return final output, hidden state, and attention weights (for visualization)
-        return output, hidden, attn_weights
-
-
-small_batch_size = 3
-input_batches, input_lengths, target_batches, target_lengths = random_batch(small_batch_size)
-
-print('input_batches', input_batches.size()) # (max_len x batch_size)
-print('target_batches', target_batches.size()) # (max_len x batch_size)
-
-small_hidden_size = 8
-small_n_layers = 2
-# input_size, embedding_size, hidden_size, n_layers=1, dropout=0.1, pre_word_embeds=None
-encoder_test = EncoderRNN(input_lang.n_words, 100, small_hidden_size, small_n_layers, pre_word_embeds=input_lang_embedding)
-decoder_test = LuongAttnDecoderRNN('general', 100, small_hidden_size, output_lang.n_words, small_n_layers, pre_word_embeds=output_lang_embedding)
-
-if USE_CUDA:
-    encoder_test.cuda()
-    decoder_test.cuda()
-
-
-encoder_outputs, encoder_hidden = encoder_test(input_batches, input_lengths, None)
-
-# print('encoder_outputs', encoder_outputs) # max_len x batch_size x hidden_size
-# print('encoder_hidden', encoder_hidden) # n_layers * 2 x batch_size x hidden_size
-
-
-max_target_length = max(target_lengths)
-
-# Prepare decoder input and outputs
-decoder_input = Variable(torch.LongTensor([SOS_token] * small_batch_size))
-decoder_hidden = encoder_hidden[:decoder_test.n_layers] # Use last (forward) hidden state from encoder
-all_decoder_outputs = Variable(torch.zeros(max_target_length, small_batch_size, decoder_test.output_size))
-
-if USE_CUDA:
-    all_decoder_outputs = all_decoder_outputs.cuda()
-    decoder_input = decoder_input.cuda()
-
-# Run through decoder one time step at a time
-for t in range(max_target_length):
-    decoder_output, decoder_hidden, decoder_attn = decoder_test(
-        decoder_input, decoder_hidden, encoder_outputs
-    )
-    all_decoder_outputs[t] = decoder_output # Store this step's outputs
-    decoder_input = target_batches[t] # Next input is current target
-
-# Test masked cross entropy loss
-loss = masked_cross_entropy(
-    all_decoder_outputs.transpose(0, 1).contiguous(),
-    target_batches.transpose(0, 1).contiguous(),
-    target_lengths
-)
-print('loss', loss.item())
-
-
-def train(input_batches, input_lengths, target_batches, target_lengths, encoder, decoder, encoder_optimizer,
-          decoder_optimizer, criterion, max_length=MAX_LENGTH):
-    # Zero gradients of both optimizers
-    encoder_optimizer.zero_grad()
-    decoder_optimizer.zero_grad()
-    loss = 0  # Added onto for each word
-
-    # Run words through encoder
-    encoder_outputs, encoder_hidden = encoder(input_batches, input_lengths, None)
-
-    # Prepare input and output variables
-    decoder_input = Variable(torch.LongTensor([SOS_token] * batch_size))
-    decoder_hidden = encoder_hidden[:decoder.n_layers]  # Use last (forward) hidden state from encoder
-
-    max_target_length = max(target_lengths)
-    all_decoder_outputs = Variable(torch.zeros(max_target_length, batch_size, decoder.output_size))
-
-    # Move new Variables to CUDA
-    if USE_CUDA:
-        decoder_input = decoder_input.cuda()
-        all_decoder_outputs = all_decoder_outputs.cuda()
-
-    # Run through decoder one time step at a time
-    for t in range(max_target_length):
-        decoder_output, decoder_hidden, decoder_attn = decoder(
-            decoder_input, decoder_hidden, encoder_outputs
-        )
-
-        all_decoder_outputs[t] = decoder_output
-        decoder_input = target_batches[t]  # Next input is current target
-
-    # Loss calculation and backpropagation
-    loss = masked_cross_entropy(
-        all_decoder_outputs.transpose(0, 1).contiguous(),  # -> batch x seq
-        target_batches.transpose(0, 1).contiguous(),  # -> batch x seq
-        target_lengths
-    )
-    loss.backward()
-
-    # Clip gradient norms
-    ec = torch.nn.utils.clip_grad_norm_(encoder.parameters(), clip)
-    dc = torch.nn.utils.clip_grad_norm_(decoder.parameters(), clip)
-
-    # Update parameters with optimizers
-    encoder_optimizer.step()
-    decoder_optimizer.step()
-
-    return loss.item(), ec, dc
-
-
-batch_size = 8
-clip = 50.0
-attn_model = 'dot'
-hidden_size = 256
-n_layers = 2
-dropout = 0.1
-
-# Configure training/optimization
-teacher_forcing_ratio = 0.5
-learning_rate = 0.0001
-decoder_learning_ratio = 5.0
-n_epochs = 10000
-epoch = 0
-plot_every = 10
-print_every = 10
-evaluate_every = 10
-USE_CUDA = True
-# Initialize models input_size, embedding_size, hidden_size, n_layers=1, dropout=0.1, pre_word_embeds=None
-encoder = EncoderRNN(input_lang.n_words, hidden_size, hidden_size, n_layers, dropout=dropout, pre_word_embeds=None)
-decoder = LuongAttnDecoderRNN(attn_model, hidden_size, hidden_size, output_lang.n_words, n_layers, dropout=dropout, pre_word_embeds=None)
-
-# Initialize optimizers and criterion
-encoder_optimizer = optim.Adam(encoder.parameters(), lr=learning_rate)
-decoder_optimizer = optim.Adam(decoder.parameters(), lr=learning_rate * decoder_learning_ratio)
-criterion = nn.CrossEntropyLoss()
-
-# Move models to GPU
-if USE_CUDA:
-    encoder.cuda()
-    decoder.cuda()
-#
-# Keep track of time elapsed and running averages
-start = time.time()
-plot_losses = []
-print_loss_total = 0 # Reset every print_every
-plot_loss_total = 0 # Reset every plot_every
 
 def as_minutes(s):
     m = math.floor(s / 60)
     s -= m * 60
     return '%dm %ds' % (m, s)
 
+
 def time_since(since, percent):
     now = time.time()
     s = now - since
@@ -552,180 +35,273 @@ def time_since(since, percent):
     return '%s (- %s)' % (as_minutes(s), as_minutes(rs))
 
 
-def evaluate(input_seq, max_length=MAX_LENGTH):
-    with torch.no_grad():
-        input_lengths = [len(input_seq.split())]
-        input_seq = input_seq.split()
-        for i in range(len(input_seq)):
-            if input_seq[i] not in input_lang.word2index:
-                input_seq[i] = "UNK"
-        input_seqs = [indexes_from_sentence(input_lang, " ".join(input_seq))]
-        # input_batches = Variable(torch.LongTensor(input_seqs), volatile=True).transpose(0, 1)
-        input_batches = Variable(torch.LongTensor(input_seqs)).transpose(0, 1)
-
-        if USE_CUDA:
-            input_batches = input_batches.cuda()
-        # Set to not-training mode to disable dropout
-        encoder.train(False)
-        decoder.train(False)
-
-        # Run through encoder
-        encoder_outputs, encoder_hidden = encoder(input_batches, input_lengths, None)
-
-        # Create starting vectors for decoder
-        # decoder_input = Variable(torch.LongTensor([SOS_token]), volatile=True)  # SOS
-        decoder_input = Variable(torch.LongTensor([SOS_token]))  # SOS
-        decoder_hidden = encoder_hidden[:decoder.n_layers]  # Use last (forward) hidden state from encoder
-
-        if USE_CUDA:
-            decoder_input = decoder_input.cuda()
-
-        # Store output words and attention states
-        decoded_words = []
-        decoder_attentions = torch.zeros(max_length + 1, max_length + 1)
-        # Run through decoder
-        for di in range(max_length):
-            decoder_output, decoder_hidden, decoder_attention = decoder(
-                decoder_input, decoder_hidden, encoder_outputs
-            )
-            # decoder_attentions[di, :decoder_attention.size(2)] += decoder_attention.squeeze(0).squeeze(0).cpu().data
-
-            # Choose top word from output
-            topv, topi = decoder_output.data.topk(1)
-            ni = topi[0][0]
-            if ni == EOS_token:
-                decoder_attentions[len(decoded_words), :decoder_attention.size(2)] += decoder_attention.squeeze(0).squeeze(0).cpu().data
-                decoded_words.append('<EOS>')
-                break
-            elif output_lang.index2word[ni.tolist()] not in decoded_words:
-                decoder_attentions[len(decoded_words), :decoder_attention.size(2)] += decoder_attention.squeeze(0).squeeze(0).cpu().data
-                decoded_words.append(output_lang.index2word[ni.tolist()])
-            else:
-                continue
-
-            # Next input is chosen word
-            decoder_input = Variable(torch.LongTensor([ni.tolist()]))
-            if USE_CUDA:
-                decoder_input = decoder_input.cuda()
-
-        # Set back to training mode
-        encoder.train(True)
-        decoder.train(True)
-
-        # return decoded_words, decoder_attentions[:di + 1, :len(encoder_outputs)]
-        return decoded_words, decoder_attentions[:len(decoded_words), :len(encoder_outputs)]
-
-
-def evaluate_randomly():
-    [input_sentence, target_sentence] = random.choice(pairs)
-    evaluate_and_show_attention(input_sentence, target_sentence)
-
-
-import io
-import torchvision
-from PIL import Image
-import visdom
-vis = visdom.Visdom(port=18084)
-
-
-def show_plot_visdom():
-    buf = io.BytesIO()
-    plt.savefig(buf)
-    buf.seek(0)
-    attn_win = 'attention (%s)' % hostname
-    vis.image(torchvision.transforms.ToTensor()(Image.open(buf)), win=attn_win, opts={'title': attn_win})
-
-
-def show_attention(input_sentence, output_words, attentions):
-    # Set up figure with colorbar
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    cax = ax.matshow(attentions.numpy(), cmap='bone')
-    fig.colorbar(cax)
-
-    # Set up axes
-    ax.set_xticklabels([''] + input_sentence.split(' ') + ['<EOS>'], rotation=90)
-    ax.set_yticklabels([''] + output_words)
-
-    # Show label at every tick
-    ax.xaxis.set_major_locator(ticker.MultipleLocator(1))
-    ax.yaxis.set_major_locator(ticker.MultipleLocator(1))
-
-    show_plot_visdom()
-    if not os.path.exists('./attention'):
-        os.mkdir('./attention')
-    plt.savefig('./attention/' + str(int(time.time())) + '.png')
-    plt.close()
-
-
-def evaluate_and_show_attention(input_sentence, target_sentence=None):
-    output_words, attentions = evaluate(input_sentence)
-    output_sentence = ' '.join(output_words)
-    print('>', input_sentence)
-    if target_sentence is not None:
-        print('=', target_sentence)
-    print('<', output_sentence)
-
-    show_attention(input_sentence, output_words, attentions)
-
-    # Show input, target, output text in visdom
-    win = 'evaluted (%s)' % hostname
-    text = '<p>&gt; %s</p><p>= %s</p><p>&lt; %s</p>' % (input_sentence, target_sentence, output_sentence)
-    vis.text(text, win=win, opts={'title': win})
-
-
-ecs = []
-dcs = []
-eca = 0
-dca = 0
-while epoch < n_epochs:
-    epoch += 1
-
-    # Get training data for this cycle
-    input_batches, input_lengths, target_batches, target_lengths = random_batch(batch_size)
-
-    # Run the train function
-    loss, ec, dc = train(
-        input_batches, input_lengths, target_batches, target_lengths,
-        encoder, decoder,
-        encoder_optimizer, decoder_optimizer, criterion
-    )
-
-    # Keep track of loss
-    print_loss_total += loss
-    plot_loss_total += loss
-    eca += ec
-    dca += dc
-
-    # job.record(epoch, loss)
-
-    if epoch % print_every == 0:
-        print_loss_avg = print_loss_total / print_every
-        print_loss_total = 0
-        print_summary = '%s (%d %d%%) %.4f' % (
-        time_since(start, epoch / n_epochs), epoch, epoch / n_epochs * 100, print_loss_avg)
-        print(print_summary)
-
-    if epoch % evaluate_every == 0:
-        evaluate_randomly()
-
-    if epoch % plot_every == 0:
-        plot_loss_avg = plot_loss_total / plot_every
-        plot_losses.append(plot_loss_avg)
-        plot_loss_total = 0
-
-        # TODO: Running average helper
-        ecs.append(eca / plot_every)
-        dcs.append(dca / plot_every)
-        ecs_win = 'encoder grad (%s)' % hostname
-        dcs_win = 'decoder grad (%s)' % hostname
-        vis.line(np.array(ecs), win=ecs_win, opts={'title': ecs_win})
-        vis.line(np.array(dcs), win=dcs_win, opts={'title': dcs_win})
-        eca = 0
-        dca = 0
-    if not os.path.exists('./model'):
-        os.makedirs('./model')
-    encoder_state = {'net': encoder.state_dict(), 'optimizer': encoder_optimizer.state_dict(), 'epoch': epoch}
-    decoder_state = {'net': decoder.state_dict(), 'optimizer': decoder.state_dict(), 'epoch': epoch}
-    torch.save(encoder_state, './model/encoder_batch.pkl')
-    torch.save(decoder_state, './model/decoder_batch.pkl')
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the attentional seq2seq model')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='CHECKPOINT',
+                        help='continue from a checkpoint (the latest in --checkpoint-dir if no path is given)')
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+
+    # Model
+    parser.add_argument('--attn-model', default='dot', choices=['dot', 'general', 'concat'])
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=2)
+    parser.add_argument('--dropout', type=float, default=0.1)
+    parser.add_argument('--adaptive-cutoffs', type=int, nargs='+',
+                        help='frequency-rank cutoffs of an adaptive softmax output layer, e.g. 2000 10000 '
+                             '(not with --loss-chunk-size)')
+
+    # Batching
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-tokens', type=int,
+                        help='build batches up to this many padded source + target tokens '
+                             '(--batch-size then caps sentences)')
+    parser.add_argument('--accumulation-steps', type=int, default=1, help='micro-batches per optimizer step')
+    parser.add_argument('--bucket-width', type=int, default=5,
+                        help='pairs within this many tokens of each other (source and target) share a bucket')
+    parser.add_argument('--num-workers', type=int, default=2,
+                        help='background batch builders (0 builds batches on the training thread)')
+    parser.add_argument('--prefetch-batches', type=int, default=4, help='ready batches queued per worker')
+
+    # Optimization
+    parser.add_argument('--n-epochs', type=int, default=10000, help='optimizer steps to train for')
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--decoder-learning-ratio', type=float, default=5.0)
+    parser.add_argument('--clip', type=float, default=50.0)
+    parser.add_argument('--step-decoder', action='store_true',
+                        help='run the teacher-forced decoder step by step instead of over the whole sequence')
+    parser.add_argument('--loss-chunk-size', type=int,
+                        help='compute the loss this many target positions at a time (not with --step-decoder)')
+    parser.add_argument('--bf16', action='store_true',
+                        help='run the forward passes and the loss under bfloat16 autocast')
+
+    # Device
+    parser.add_argument('--cpu', action='store_true', help='train on the CPU even when a GPU is available')
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads (default: one per physical core)')
+    parser.add_argument('--interop-threads', type=int, help='CPU inter-op threads')
+
+    # Reporting and checkpoints
+    parser.add_argument('--print-every', type=int, default=10)
+    parser.add_argument('--evaluate-every', type=int, default=10)
+    parser.add_argument('--plot-every', type=int, default=10)
+    parser.add_argument('--visdom-port', type=int, default=18084, help='0 disables visdom')
+    parser.add_argument('--log-dir', default=ATTENTION_DIR,
+                        help='directory for attention PNGs and JSONL logs of samples and scalars ("" disables)')
+    parser.add_argument('--max-pending-plots', type=int, default=16,
+                        help='samples queued for the visualization worker before new ones are dropped')
+    parser.add_argument('--metrics-every', type=int, default=0,
+                        help='time every phase of the step and write throughput and memory to --metrics-file '
+                             'every this many steps (0 disables the timers)')
+    parser.add_argument('--metrics-file', default=METRICS_FILE)
+    parser.add_argument('--profile', action='store_true',
+                        help='run only --profile-warmup + --profile-steps steps under torch.profiler and write a '
+                             'Chrome trace and a top-operators table to --profile-dir')
+    parser.add_argument('--profile-warmup', type=int, default=3)
+    parser.add_argument('--profile-steps', type=int, default=5)
+    parser.add_argument('--profile-dir', default=PROFILE_DIR)
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    parser.add_argument('--checkpoint-every-steps', type=int, default=1000)
+    parser.add_argument('--checkpoint-every-minutes', type=float, default=30,
+                        help='also checkpoint whenever this many minutes have passed since the last one')
+    parser.add_argument('--keep-checkpoints', type=int, default=3, help='older checkpoints are deleted (0 keeps all)')
+
+    # Validation
+    parser.add_argument('--validate-every', type=int, default=1000,
+                        help='report validation loss, perplexity and ROUGE every this many steps (0 disables)')
+    parser.add_argument('--valid-batch-size', type=int, default=64)
+    parser.add_argument('--valid-max-sentences', type=int, default=2000,
+                        help='validate on a fixed sample of this many pairs (0 uses all of them)')
+    parser.add_argument('--valid-max-seconds', type=float, help='cut a validation pass short after this long')
+    parser.add_argument('--validate-process', action='store_true',
+                        help='validate every new checkpoint in a separate process (validate.py --watch) instead '
+                             'of pausing training')
+    parser.add_argument('--valid-results', default=RESULTS_FILE,
+                        help='JSONL file the --validate-process results are appended to')
+    args = parser.parse_args(argv)
+    if args.loss_chunk_size and args.step_decoder:
+        parser.error('--loss-chunk-size needs the sequence decoder, not --step-decoder')
+    if args.loss_chunk_size and args.adaptive_cutoffs:
+        parser.error('--loss-chunk-size applies to the dense output layer, not --adaptive-cutoffs')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(2018)
+    torch.manual_seed(2018)
+    configure_cpu(args.threads, args.interop_threads)
+    device = get_device(not args.cpu)
+    print('Running on %s with %d CPU threads' % (device, torch.get_num_threads()))
+
+    # Compile the corpus on first use, afterwards it is memory-mapped (see preprocess.py)
+    if not is_compiled(args.data_dir):
+        compile_corpus(args.data_dir)
+    input_lang, output_lang, (train_src, train_tgt), (valid_src, valid_tgt) = load_corpus(args.data_dir)
+    print('Loaded %d train pairs, %d valid pairs, %d words in input language, %d words in output' % (
+        len(train_src), len(valid_src), input_lang.n_words, output_lang.n_words))
+
+    # Everything needed to rebuild the models from a checkpoint (see evaluate.py)
+    config = {'attn_model': args.attn_model, 'hidden_size': args.hidden_size, 'n_layers': args.n_layers,
+              'dropout': args.dropout, 'adaptive_cutoffs': args.adaptive_cutoffs}
+    encoder, decoder = build_models(input_lang, output_lang, n_targets=len(train_tgt), **config)
+    prepare_model(encoder, device)
+    prepare_model(decoder, device)
+    timer = PhaseTimer(enabled=args.metrics_every > 0, device=device)
+    trainer = Trainer(encoder, decoder, args.learning_rate, args.decoder_learning_ratio, args.clip,
+                      sequence_decoder=not args.step_decoder, loss_chunk_size=args.loss_chunk_size,
+                      use_bf16=args.bf16, timer=timer)
+
+    # Length-bucketed epochs over the training pairs (lengths include EOS)
+    batch_sampler = BucketBatchSampler(train_src.lengths() + 1, train_tgt.lengths() + 1, args.batch_size,
+                                       args.bucket_width, max_tokens=args.max_tokens, seed=2018)
+
+    # Restore models, optimizers, step counter, data order and RNGs of an interrupted run
+    epoch = 0
+    if args.resume:
+        resume_path = latest_checkpoint(args.checkpoint_dir) if args.resume == 'latest' else args.resume
+        if resume_path is None:
+            raise SystemExit('No checkpoint to resume from in %s' % args.checkpoint_dir)
+        checkpoint = load_checkpoint(resume_path)
+        trainer.load_state_dict(checkpoint)
+        batch_sampler.load_state_dict(checkpoint['sampler'])
+        set_rng_state(checkpoint['rng'])
+        epoch = checkpoint['epoch']
+        print('Resumed from %s at step %d' % (resume_path, epoch))
+        del checkpoint
+
+    train_dataset = PairDataset(train_src, train_tgt, EOS_token)
+    valid_dataset = PairDataset(valid_src, valid_tgt, EOS_token)
+    train_batches = BatchStream(make_loader(train_dataset, batch_sampler, PAD_token, args.num_workers,
+                                            args.prefetch_batches, pin_memory=device.type == 'cuda'), device)
+    evaluator = Evaluator(encoder, decoder, input_lang, output_lang, device, use_bf16=args.bf16)
+    sinks = []
+    if args.visdom_port:
+        sinks.append(VisdomSink(args.visdom_port))
+    if args.log_dir:
+        sinks.append(LocalSink(args.log_dir))
+    visualizer = VisualizationWorker(sinks, args.max_pending_plots)
+    metrics = MetricsLog(args.metrics_file, timer, device) if args.metrics_every else None
+    checkpointer = Checkpointer(args.checkpoint_dir, args.checkpoint_every_steps, args.checkpoint_every_minutes,
+                                args.keep_checkpoints)
+
+    def training_state():
+        state = trainer.state_dict()
+        state.update(epoch=epoch, config=config, sampler=batch_sampler.state_dict(), rng=rng_state())
+        return state
+
+    def validate():
+        result = evaluator.validate(validation_batches(valid_dataset, args.valid_batch_size, PAD_token,
+                                                       args.valid_max_sentences),
+                                    max_seconds=args.valid_max_seconds, loss_chunk_size=args.loss_chunk_size)
+        print('Step %d: %s' % (epoch, format_result(result)))
+        for name in ('loss', 'perplexity', 'rouge-1', 'rouge-2', 'rouge-l'):
+            visualizer.scalar('valid ' + name, epoch, result[name])
+
+    def evaluate_randomly():
+        pair = random.randrange(len(train_src))
+        input_sentence = sentence_from_indexes(input_lang, train_src[pair])
+        target_sentence = sentence_from_indexes(output_lang, train_tgt[pair])
+        evaluate_and_show_attention(evaluator, visualizer, epoch, input_sentence, target_sentence)
+
+    n_epochs = args.n_epochs
+    profiler = None
+    if args.profile:
+        n_epochs = min(n_epochs, epoch + args.profile_warmup + args.profile_steps)
+        profiler = make_profiler(args.profile_dir, device, warmup=args.profile_warmup, active=args.profile_steps)
+        profiler.start()
+
+    # The validation process picks up each checkpoint as it is written
+    validator = None
+    if args.validate_every and args.validate_process and not args.profile:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'validate.py'),
+                   '--watch', '--checkpoint-dir', args.checkpoint_dir, '--data-dir', args.data_dir,
+                   '--results', args.valid_results, '--batch-size', str(args.valid_batch_size)]
+        if args.valid_max_sentences:
+            command += ['--max-sentences', str(args.valid_max_sentences)]
+        if args.valid_max_seconds:
+            command += ['--max-seconds', str(args.valid_max_seconds)]
+        if args.cpu:
+            command.append('--cpu')
+        validator = subprocess.Popen(command)
+
+    # Keep track of time elapsed and running averages
+    start = time.time()
+    plot_losses = []
+    print_loss_total = 0  # Reset every print_every
+    plot_loss_total = 0  # Reset every plot_every
+    print_padding_total = 0  # Reset every print_every
+    eca = 0
+    dca = 0
+    while epoch < n_epochs:
+        epoch += 1
+
+        # Get training data for this cycle
+        batches = []
+        for _ in range(args.accumulation_steps):
+            with timer.phase('data'):
+                batch = next(train_batches)
+            print_padding_total += padding_ratio(batch[1], batch[3]) / args.accumulation_steps
+            if metrics:
+                metrics.batch(batch[1], batch[3])
+            batches.append(batch)
+
+        # Run the train function
+        loss, ec, dc = trainer.train(batches)
+        if metrics:
+            metrics.step(loss)
+            if epoch % args.metrics_every == 0:
+                metrics.write(epoch)
+        if profiler:
+            profiler.step()
+
+        # Keep track of loss
+        print_loss_total += loss
+        plot_loss_total += loss
+        eca += ec
+        dca += dc
+
+        if epoch % args.print_every == 0:
+            print_loss_avg = print_loss_total / args.print_every
+            print_loss_total = 0
+            print_padding_avg = print_padding_total / args.print_every
+            print_padding_total = 0
+            print_summary = '%s (%d %d%%) %.4f, data epoch %d, padding %.1f%%, data wait %.2fs' % (
+                time_since(start, epoch / args.n_epochs), epoch, epoch / args.n_epochs * 100, print_loss_avg,
+                batch_sampler.epoch, print_padding_avg * 100, train_batches.pop_wait_time())
+            print(print_summary)
+
+        if epoch % args.evaluate_every == 0:
+            evaluate_randomly()
+
+        if epoch % args.plot_every == 0:
+            plot_loss_avg = plot_loss_total / args.plot_every
+            plot_losses.append(plot_loss_avg)
+            plot_loss_total = 0
+
+            # TODO: Running average helper
+            visualizer.scalar('encoder grad', epoch, eca / args.plot_every)
+            visualizer.scalar('decoder grad', epoch, dca / args.plot_every)
+            eca = 0
+            dca = 0
+
+        if args.validate_every and not args.validate_process and not profiler and epoch % args.validate_every == 0:
+            validate()
+
+        if checkpointer.due(epoch) and not profiler:
+            checkpointer.save(epoch, training_state())
+
+    if profiler:
+        profiler.stop()
+    elif checkpointer.last_step != epoch:
+        checkpointer.save(epoch, training_state())
+    checkpointer.wait()
+    if validator:
+        validator.terminate()
+    if metrics:
+        metrics.close()
+    visualizer.close()
+    if visualizer.dropped:
+        print('Dropped %d visualization samples while the worker was busy' % visualizer.dropped)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import torch
+from torch import optim
+
+from device import autocast, prepare_model
+from lang import EOS_token, SOS_token
+from metrics import NULL_TIMER
+from masked_cross_entropy import masked_cross_entropy, chunked_masked_cross_entropy, masked_adaptive_cross_entropy
+from model import EncoderRNN, LuongAttnDecoderRNN, AdaptiveOutput, attention_mask
+from profiling import label
+
+
+# Encoder and decoder for a pair of vocabularies; n_targets (the number of
+# training targets, each ending with EOS) only matters with adaptive_cutoffs
+def build_models(input_lang, output_lang, attn_model='dot', hidden_size=256, n_layers=2, dropout=0.1,
+                 adaptive_cutoffs=None, n_targets=0):
+    encoder = EncoderRNN(input_lang.n_words, hidden_size, hidden_size, n_layers, dropout=dropout)
+    output_layer = None
+    if adaptive_cutoffs:
+        # Output words ranked by training frequency
+        output_counts = [output_lang.word2count.get(output_lang.index2word[i], 0) for i in range(output_lang.n_words)]
+        output_counts[EOS_token] = n_targets
+        output_layer = AdaptiveOutput(hidden_size, output_counts, adaptive_cutoffs)
+    decoder = LuongAttnDecoderRNN(attn_model, hidden_size, hidden_size, output_lang.n_words, n_layers, dropout=dropout,
+                                  output_layer=output_layer)
+    return encoder, decoder
+
+
+# Encoder and decoder of a checkpoint saved by train.py, rebuilt from its config
+# and moved to device. Without a checkpoint they are untrained and default-size.
+def load_models(checkpoint, input_lang, output_lang, device=torch.device('cpu')):
+    if checkpoint is None:
+        encoder, decoder = build_models(input_lang, output_lang)
+    else:
+        encoder, decoder = build_models(input_lang, output_lang, **checkpoint['config'])
+        encoder.load_state_dict(checkpoint['encoder'])
+        decoder.load_state_dict(checkpoint['decoder'])
+    return prepare_model(encoder, device), prepare_model(decoder, device)
+
+
+# timer (a metrics.PhaseTimer) times the encoder, decoder and loss phases
+def compute_loss(input_batches, input_lengths, target_batches, target_lengths, encoder, decoder,
+                 sequence_decoder=True, loss_chunk_size=None, timer=NULL_TIMER):
+    # Run words through encoder
+    with timer.phase('encoder'):
+        encoder_outputs, encoder_hidden = encoder(input_batches, input_lengths, None)
+        attn_keys = decoder.attn.precompute(encoder_outputs)
+        attn_mask = attention_mask(input_lengths, encoder_outputs)
+
+    # Prepare input and output variables
+    this_batch_size = input_batches.size(1)
+    decoder_input = torch.LongTensor([SOS_token] * this_batch_size).to(input_batches.device)
+    decoder_hidden = encoder_hidden[:decoder.n_layers]  # Use last (forward) hidden state from encoder
+
+    max_target_length = max(target_lengths)
+
+    if sequence_decoder:
+        # Every step is teacher forced, so the decoder inputs (SOS followed by the
+        # targets shifted by one) are known up front and run through in one pass
+        decoder_inputs = torch.cat((decoder_input.unsqueeze(0), target_batches[:max_target_length - 1]), 0)
+        if isinstance(decoder.out, AdaptiveOutput) or loss_chunk_size:
+            # These losses apply the output layer themselves, so their phase includes it
+            with timer.phase('decoder'):
+                decoder_features, decoder_hidden, decoder_attn = decoder.features(
+                    decoder_inputs, decoder_hidden, encoder_outputs, attn_keys, attn_mask
+                )
+            with timer.phase('loss'), label('loss'):
+                if isinstance(decoder.out, AdaptiveOutput):
+                    # The adaptive softmax only scores the clusters each target falls in
+                    return masked_adaptive_cross_entropy(decoder_features, decoder.out, target_batches,
+                                                         target_lengths)
+                # Memory-bounded loss: the output layer is applied chunk by chunk inside the loss
+                return chunked_masked_cross_entropy(
+                    decoder_features, decoder.out.weight, decoder.out.bias, target_batches, target_lengths,
+                    loss_chunk_size
+                )
+        with timer.phase('decoder'):
+            all_decoder_outputs, decoder_hidden, decoder_attn = decoder.forward_sequence(
+                decoder_inputs, decoder_hidden, encoder_outputs, attn_keys, attn_mask
+            )
+    else:
+        with timer.phase('decoder'):
+            all_decoder_outputs = torch.zeros(max_target_length, this_batch_size, decoder.output_size,
+                                              device=input_batches.device)
+
+            # Run through decoder one time step at a time
+            for t in range(max_target_length):
+                decoder_output, decoder_hidden, decoder_attn = decoder(
+                    decoder_input, decoder_hidden, encoder_outputs, attn_keys, attn_mask
+                )
+
+                all_decoder_outputs[t] = decoder_output
+                decoder_input = target_batches[t]  # Next input is current target
+
+    # Loss calculation
+    with timer.phase('loss'), label('loss'):
+        return masked_cross_entropy(
+            all_decoder_outputs.transpose(0, 1).contiguous(),  # -> batch x seq
+            target_batches.transpose(0, 1).contiguous(),  # -> batch x seq
+            target_lengths
+        )
+
+
+class Trainer:
+    # Optimizers for an encoder/decoder pair and the update step. The models
+    # must already be on their device (see device.prepare_model). timer times
+    # the phases of every step (see metrics.PhaseTimer).
+    def __init__(self, encoder, decoder, learning_rate=0.0001, decoder_learning_ratio=5.0, clip=50.0,
+                 sequence_decoder=True, loss_chunk_size=None, use_bf16=False, timer=NULL_TIMER):
+        self.encoder = encoder
+        self.decoder = decoder
+        self.encoder_optimizer = optim.Adam(encoder.parameters(), lr=learning_rate)
+        self.decoder_optimizer = optim.Adam(decoder.parameters(), lr=learning_rate * decoder_learning_ratio)
+        self.clip = clip
+        self.sequence_decoder = sequence_decoder
+        self.loss_chunk_size = loss_chunk_size
+        self.use_bf16 = use_bf16
+        self.timer = timer
+
+    # One optimizer step over a list of (input_batches, input_lengths, target_batches,
+    # target_lengths) micro-batches. Returns the loss and both gradient norms.
+    def train(self, batches):
+        # Zero gradients of both optimizers
+        self.encoder_optimizer.zero_grad()
+        self.decoder_optimizer.zero_grad()
+        total_loss = 0
+
+        # Accumulate gradients over the micro-batches, weighting each by its share of target
+        # tokens so the update equals the one for a single batch holding all of them
+        n_tokens = sum(sum(target_lengths) for _, _, _, target_lengths in batches)
+        for input_batches, input_lengths, target_batches, target_lengths in batches:
+            with autocast(input_batches.device, self.use_bf16):
+                loss = compute_loss(input_batches, input_lengths, target_batches, target_lengths,
+                                    self.encoder, self.decoder, self.sequence_decoder, self.loss_chunk_size,
+                                    self.timer)
+            weight = sum(target_lengths) / n_tokens
+            with self.timer.phase('backward'):
+                (loss * weight).backward()
+            total_loss += loss.item() * weight
+
+        # Clip gradient norms
+        with self.timer.phase('clip'):
+            ec = torch.nn.utils.clip_grad_norm_(self.encoder.parameters(), self.clip)
+            dc = torch.nn.utils.clip_grad_norm_(self.decoder.parameters(), self.clip)
+
+        # Update parameters with optimizers
+        with self.timer.phase('optimizer'):
+            self.encoder_optimizer.step()
+            self.decoder_optimizer.step()
+
+        return total_loss, ec, dc
+
+    def state_dict(self):
+        return {
+            'encoder': self.encoder.state_dict(),
+            'decoder': self.decoder.state_dict(),
+            'encoder_optimizer': self.encoder_optimizer.state_dict(),
+            'decoder_optimizer': self.decoder_optimizer.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.encoder.load_state_dict(state['encoder'])
+        self.decoder.load_state_dict(state['decoder'])
+        self.encoder_optimizer.load_state_dict(state['encoder_optimizer'])
+        self.decoder_optimizer.load_state_dict(state['decoder_optimizer'])
@@ -1,13 +1,21 @@
 from nltk.tokenize import word_tokenize
 import re
 import collections
+import itertools
+import multiprocessing
+import os
 import pickle
+import shutil
+import time
 import numpy as np
+from token_store import TokenArrayWriter, TokenArray, write_vocab, read_vocab
 
 train_article_path = "sumdata/train/train.article.txt"
 train_title_path = "sumdata/train/train.title.txt"
 valid_article_path = "sumdata/train/valid.article.filter.txt"
 valid_title_path = "sumdata/train/valid.title.filter.txt"
+article_max_len = 50
+summary_max_len = 15
 
 
 def clean_str(sentence):
@@ -33,7 +41,8 @@ def build_dict(step, toy=False):
             for word in word_tokenize(sentence):
                 words.append(word)
 
-        word_counter = collections.Counter(words).most_common()
+        # Ordered by count, then word, like preprocess_parallel, so both give the same ids
+        word_counter = sorted(collections.Counter(words).items(), key=lambda wc: (-wc[1], wc[0]))
         word_dict = dict()
         word_dict["<padding>"] = 0
         word_dict["<unk>"] = 1
@@ -51,9 +60,6 @@ def build_dict(step, toy=False):
 
     reversed_dict = dict(zip(word_dict.values(), word_dict.keys()))
 
-    article_max_len = 50
-    summary_max_len = 15
-
     return word_dict, reversed_dict, article_max_len, summary_max_len
 
 
@@ -80,6 +86,121 @@ def build_dataset(step, word_dict, article_max_len, summary_max_len, toy=False):
         return x, y
 
 
+def load_compiled_dataset(step, out_dir="sumdata/compiled"):
+    x = TokenArray(os.path.join(out_dir, "%s.article" % step))
+    if step == "valid":
+        return x
+    else:
+        return x, TokenArray(os.path.join(out_dir, "%s.title" % step))
+
+
+def read_chunks(paths, chunk_size, toy):
+    # Yields (chunk_id, [lines of paths[0], lines of paths[1], ...]) without reading whole files
+    files = [open(path, "r", encoding="utf-8") for path in paths]
+    try:
+        lines = zip(*files)
+        if toy:
+            lines = itertools.islice(lines, 50000)
+        for chunk_id in itertools.count():
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+            yield chunk_id, [list(field) for field in zip(*chunk)]
+    finally:
+        for f in files:
+            f.close()
+
+
+def tokenize_chunk(args):
+    # Pool worker: tokenizes one chunk, pickles it to a shard file and returns the word counts
+    chunk_id, fields, shard_dir = args
+    counter = collections.Counter()
+    tokenized = []
+    for lines in fields:
+        field = [word_tokenize(clean_str(x.strip())) for x in lines]
+        for words in field:
+            counter.update(words)
+        tokenized.append(field)
+    with open(os.path.join(shard_dir, "%06d.pickle" % chunk_id), "wb") as f:
+        pickle.dump(tokenized, f)
+    return chunk_id, len(fields[0]), counter
+
+
+# Parallel version of build_dict + build_dataset: tokenizes every line once in a
+# process pool, merges the per-chunk counts into the vocabulary (sorted by count,
+# then word, so it is reproducible) and streams the indexed sequences into token
+# arrays under out_dir, to be memory-mapped by load_compiled_dataset
+def preprocess_parallel(step, out_dir="sumdata/compiled", toy=False, workers=None, chunk_size=10000):
+    if step == "train":
+        paths = [train_article_path, train_title_path]
+    elif step == "valid":
+        paths = [valid_article_path]
+    else:
+        raise NotImplementedError
+    fields = [("article", article_max_len), ("title", summary_max_len - 1)][:len(paths)]
+
+    shard_dir = os.path.join(out_dir, "shards.%s" % step)
+    if not os.path.exists(shard_dir):
+        os.makedirs(shard_dir)
+
+    start = time.time()
+    word_counter = collections.Counter()
+    n_lines = 0
+    n_chunks = 0
+    workers = workers or os.cpu_count()
+    pool = multiprocessing.Pool(workers)
+    try:
+        # At most 2 chunks per worker in flight, so the input is never read ahead in full;
+        # the trailing None drains what is left
+        pending = collections.deque()
+        for chunk in itertools.chain(read_chunks(paths, chunk_size, toy), [None]):
+            if chunk is not None:
+                pending.append(pool.apply_async(tokenize_chunk, (chunk + (shard_dir,),)))
+            while pending and (chunk is None or len(pending) >= 2 * workers):
+                _, chunk_lines, counter = pending.popleft().get()
+                word_counter.update(counter)
+                n_lines += chunk_lines
+                n_chunks += 1
+                print("Tokenized %d lines (%d chunks, %.1fs)" % (n_lines, n_chunks, time.time() - start))
+    finally:
+        pool.close()
+        pool.join()
+
+    if step == "train":
+        word_dict = dict()
+        word_dict["<padding>"] = 0
+        word_dict["<unk>"] = 1
+        word_dict["<s>"] = 2
+        word_dict["</s>"] = 3
+        for word, _ in sorted(word_counter.items(), key=lambda wc: (-wc[1], wc[0])):
+            word_dict[word] = len(word_dict)
+
+        with open("word_dict.pickle", "wb") as f:
+            pickle.dump(word_dict, f)
+        words = sorted(word_dict, key=word_dict.get)
+        write_vocab(os.path.join(out_dir, "vocab"), words, [word_counter[word] for word in words])
+    else:
+        with open("word_dict.pickle", "rb") as f:
+            word_dict = pickle.load(f)
+
+    # Index the shards in order, straight into the token arrays
+    writers = [TokenArrayWriter(os.path.join(out_dir, "%s.%s" % (step, field))) for field, _ in fields]
+    try:
+        for chunk_id in range(n_chunks):
+            with open(os.path.join(shard_dir, "%06d.pickle" % chunk_id), "rb") as f:
+                tokenized = pickle.load(f)
+            for writer, (_, max_len), field in zip(writers, fields, tokenized):
+                for words in field:
+                    writer.append([word_dict.get(w, word_dict["<unk>"]) for w in words][:max_len])
+    finally:
+        for writer in writers:
+            writer.close()
+    shutil.rmtree(shard_dir)
+    print("Indexed %d lines into %s (%.1fs)" % (n_lines, out_dir, time.time() - start))
+
+    return word_dict
+
+
 def batch_iter(inputs, outputs, batch_size, num_epochs):
     inputs = np.array(inputs)
     outputs = np.array(outputs)
@@ -92,27 +213,63 @@ def batch_iter(inputs, outputs, batch_size, num_epochs):
             yield inputs[start_index:end_index], outputs[start_index:end_index]
 
 
+glove_file = "embedding/glove.6B.100d.txt"
+
+
+# One-time conversion of the GloVe text file into a float32 .npy matrix
+# (memory-mapped on load) plus a .vocab file with one word per row
+def convert_glove(glove_path=glove_file, embedding_size=100):
+    prefix = os.path.splitext(glove_path)[0]
+    with open(glove_path, encoding="utf-8") as f:
+        n_words = sum(1 for _ in f)
+
+    print("Converting {} Glove vectors...".format(n_words))
+    vectors = np.lib.format.open_memmap(prefix + ".npy", mode="w+", dtype=np.float32, shape=(n_words, embedding_size))
+    words = list()
+    with open(glove_path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            s = line.rstrip().split(" ")
+            assert len(s) == embedding_size + 1
+            words.append(s[0])
+            vectors[i] = np.array(s[1:], dtype=np.float32)
+    vectors.flush()
+    del vectors
+    write_vocab(prefix + ".vocab", words)
+
+
 def get_init_embedding(input_lang, embedding_size=100):
-    glove_file = "embedding/glove.6B.100d.txt"
+    prefix = os.path.splitext(glove_file)[0]
+    if not os.path.exists(prefix + ".vocab"):
+        convert_glove(glove_file, embedding_size)
+
     print("Loading Glove vectors...")
-    glove_vectors = dict()
-    for line in open(glove_file):
-        s = line.rstrip().split()
-        assert len(s) == 101
-        glove_vectors[s[0]] = np.array([float(i) for i in s[1:]])
-    print('Glove contains {} words'.format(len(glove_vectors)))
-    word_vec_list = list()
-    for _, word in sorted(input_lang.index2word.items()):
-        try:
-            word_vec = glove_vectors[word]
-        except KeyError:
-            word_vec = np.zeros([embedding_size], dtype=np.float32)
-
-        word_vec_list.append(word_vec)
+    glove_vectors = np.load(prefix + ".npy", mmap_mode="r")
+    glove_words, _ = read_vocab(prefix + ".vocab")
+    glove_index = dict(zip(glove_words, range(len(glove_words))))
+    print('Glove contains {} words'.format(len(glove_words)))
+
+    # Look the whole vocabulary up at once; words missing from Glove stay zero
+    words = [word for _, word in sorted(input_lang.index2word.items())]
+    rows = np.array([glove_index.get(word, -1) for word in words])
+    found = rows >= 0
+    word_vecs = np.zeros([len(words), embedding_size], dtype=np.float32)
+    word_vecs[found] = glove_vectors[rows[found]]
 
     # Assign random vector to <s>, </s> token
-    word_vec_list[1] = np.random.normal(0, 1, embedding_size)
-    word_vec_list[2] = np.random.normal(0, 1, embedding_size)
+    word_vecs[1] = np.random.normal(0, 1, embedding_size)
+    word_vecs[2] = np.random.normal(0, 1, embedding_size)
+
+    return word_vecs
+
 
-    return np.array(word_vec_list)
+if __name__ == "__main__":
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Tokenize and index sumdata/ into token arrays")
+    parser.add_argument("step", choices=["train", "valid"])
+    parser.add_argument("--out-dir", default="sumdata/compiled")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--toy", action="store_true")
+    args = parser.parse_args()
+    preprocess_parallel(args.step, args.out_dir, args.toy, args.workers, args.chunk_size)
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from batching import PairDataset, sorted_batches
+from checkpoint import CHECKPOINT_DIR, latest_checkpoint, load_checkpoint
+from device import get_device, configure_cpu
+from evaluator import Evaluator
+from lang import PAD_token, EOS_token
+from preprocess import COMPILED_DIR, load_corpus
+from trainer import load_models
+
+RESULTS_FILE = './model/validation.jsonl'
+
+
+# Length-sorted batches over the validation pairs. With max_sentences, a fixed
+# random sample of them, so repeated validations are comparable and the cost
+# is bounded however large the validation set is.
+def validation_batches(dataset, batch_size, pad_token, max_sentences=None, seed=2018):
+    indices = None
+    if max_sentences and max_sentences < len(dataset):
+        indices = np.random.RandomState(seed).choice(len(dataset), max_sentences, replace=False).tolist()
+    return sorted_batches(dataset, batch_size, pad_token, indices=indices)
+
+
+def format_result(result):
+    return 'valid loss %.4f, perplexity %.2f, ROUGE-1 %.2f, ROUGE-2 %.2f, ROUGE-L %.2f (%d sentences, %.1fs)' % (
+        result['loss'], result['perplexity'], 100 * result['rouge-1'], 100 * result['rouge-2'],
+        100 * result['rouge-l'], result['sentences'], result['seconds'])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Validation loss, perplexity and ROUGE of a checkpoint')
+    parser.add_argument('--checkpoint', help='checkpoint saved by train.py (default: the latest in --checkpoint-dir)')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    parser.add_argument('--watch', action='store_true',
+                        help='keep validating every new checkpoint in --checkpoint-dir (run alongside train.py)')
+    parser.add_argument('--poll-seconds', type=float, default=30)
+    parser.add_argument('--data-dir', default=COMPILED_DIR)
+    parser.add_argument('--results', default=RESULTS_FILE, help='JSONL file the results are appended to')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-sentences', type=int, help='validate on a fixed sample of this many pairs')
+    parser.add_argument('--max-seconds', type=float, help='stop after the batch that exceeds this')
+    parser.add_argument('--max-length', type=int, default=30)
+    parser.add_argument('--cpu', action='store_true')
+    parser.add_argument('--threads', type=int, help='CPU intra-op threads')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_cpu(args.threads)
+    device = get_device(not args.cpu)
+    input_lang, output_lang, _, (valid_src, valid_tgt) = load_corpus(args.data_dir)
+    dataset = PairDataset(valid_src, valid_tgt, EOS_token)
+
+    def validate_checkpoint(path):
+        checkpoint = load_checkpoint(path)
+        encoder, decoder = load_models(checkpoint, input_lang, output_lang, device)
+        evaluator = Evaluator(encoder, decoder, input_lang, output_lang, device)
+        result = evaluator.validate(validation_batches(dataset, args.batch_size, PAD_token, args.max_sentences),
+                                    args.max_length, args.max_seconds)
+        print('%s (step %d): %s' % (path, checkpoint['epoch'], format_result(result)))
+        result.update(checkpoint=path, step=checkpoint['epoch'])
+        if os.path.dirname(args.results):
+            os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+
+    if not args.watch:
+        path = args.checkpoint or latest_checkpoint(args.checkpoint_dir)
+        if path is None:
+            raise SystemExit('No checkpoint in %s' % args.checkpoint_dir)
+        validate_checkpoint(path)
+        return
+
+    validated = None
+    while True:
+        path = latest_checkpoint(args.checkpoint_dir)
+        if path is not None and path != validated:
+            try:
+                validate_checkpoint(path)
+            except FileNotFoundError:
+                pass  # Removed by the retention policy before it could be read
+            validated = path
+        else:
+            time.sleep(args.poll_seconds)
+
+
+if __name__ == '__main__':
+    main()
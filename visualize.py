@@ -0,0 +1,163 @@
+import io
+import json
+import os
+import queue
+import socket
+import threading
+import traceback
+
+ATTENTION_DIR = './attention'
+
+
+# PNG of an attention matrix (output words x input words). Uses matplotlib's
+# object API rather than pyplot, whose global state is not thread-safe, and is
+# imported on first use: matplotlib alone takes longer to load than the rest
+def render_attention(input_sentence, output_words, attentions):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.ticker as ticker
+
+    # Set up figure with colorbar
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    cax = ax.matshow(attentions.numpy(), cmap='bone')
+    fig.colorbar(cax)
+
+    # Set up axes
+    ax.set_xticklabels([''] + input_sentence.split(' ') + ['<EOS>'], rotation=90, fontname='SimHei')
+    ax.set_yticklabels([''] + output_words, fontname='SimHei')
+
+    # Show label at every tick
+    ax.xaxis.set_major_locator(ticker.MultipleLocator(1))
+    ax.yaxis.set_major_locator(ticker.MultipleLocator(1))
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+class VisdomSink:
+    # Attention plots, decoded examples and scalar curves on a visdom server,
+    # connected to on first use
+    def __init__(self, port=18084):
+        self.port = port
+        self.hostname = socket.gethostname()
+        self.curves = {}
+        self._vis = None
+
+    @property
+    def vis(self):
+        if self._vis is None:
+            import visdom
+            self._vis = visdom.Visdom(port=self.port)
+        return self._vis
+
+    def window(self, name):
+        return '%s (%s)' % (name, self.hostname)
+
+    def attention(self, step, input_sentence, target_sentence, output_words, attentions, png):
+        import torchvision
+        from PIL import Image
+
+        attn_win = self.window('attention')
+        self.vis.image(torchvision.transforms.ToTensor()(Image.open(io.BytesIO(png))), win=attn_win,
+                       opts={'title': attn_win})
+
+        # Show input, target, output text in visdom
+        win = self.window('evaluted')
+        text = '<p>&gt; %s</p><p>= %s</p><p>&lt; %s</p>' % (input_sentence, target_sentence, ' '.join(output_words))
+        self.vis.text(text, win=win, opts={'title': win})
+
+    def scalar(self, name, step, value):
+        import numpy as np
+
+        steps, values = self.curves.setdefault(name, ([], []))
+        steps.append(step)
+        values.append(value)
+        win = self.window(name)
+        self.vis.line(np.array(values), np.array(steps), win=win, opts={'title': win})
+
+
+class LocalSink:
+    # Everything in a directory: one PNG per attention plot, the decoded
+    # examples in samples.jsonl and scalars in scalars.jsonl
+    def __init__(self, directory=ATTENTION_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, name, record):
+        with open(os.path.join(self.directory, name), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def attention(self, step, input_sentence, target_sentence, output_words, attentions, png):
+        png_name = 'attention_%08d.png' % step
+        with open(os.path.join(self.directory, png_name), 'wb') as f:
+            f.write(png)
+        self.append('samples.jsonl', {'step': step, 'input': input_sentence, 'target': target_sentence,
+                                      'output': output_words, 'attention': attentions.tolist(), 'png': png_name})
+
+    def scalar(self, name, step, value):
+        self.append('scalars.jsonl', {'step': step, 'name': name, 'value': value})
+
+
+class VisualizationWorker:
+    # Renders and sends attention samples and scalars to the sinks on a
+    # background thread, so training never waits on matplotlib, the disk or
+    # the network. At most max_pending items wait in the queue; further ones
+    # are dropped (and counted) until the worker catches up. Sink errors are
+    # printed and do not stop training.
+    def __init__(self, sinks, max_pending=16):
+        self.sinks = sinks
+        self.queue = queue.Queue(max_pending)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    # attentions: a CPU tensor of (output words x input words)
+    def attention(self, step, input_sentence, target_sentence, output_words, attentions):
+        self.submit(('attention', (step, input_sentence, target_sentence, list(output_words),
+                                   attentions.detach().cpu())))
+
+    def scalar(self, name, step, value):
+        self.submit(('scalar', (name, step, float(value))))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            kind, args = item
+            try:
+                if kind == 'attention':
+                    args = args + (render_attention(args[1], args[3], args[4]),)
+            except Exception:
+                traceback.print_exc()
+                continue
+            for sink in self.sinks:
+                try:
+                    getattr(sink, kind)(*args)
+                except Exception:
+                    traceback.print_exc()
+
+    # Waits for everything queued so far to be written
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def evaluate_and_show_attention(evaluator, worker, step, input_sentence, target_sentence=None):
+    output_words, attentions = evaluator.evaluate(input_sentence)
+    output_sentence = ' '.join(output_words)
+    print('>', input_sentence)
+    if target_sentence is not None:
+        print('=', target_sentence)
+    print('<', output_sentence)
+
+    worker.attention(step, input_sentence, target_sentence, output_words, attentions)